@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Comment, UserProfile, Conversation, Message
+from .models import Post, Comment, UserProfile, Conversation, ConversationMember, Message
 
 # Register your models here.
 
@@ -25,7 +25,7 @@ class CommentAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'bio_preview', 'get_followers_count', 'get_following_count', 'created_at')
+    list_display = ('user', 'bio_preview', 'followers_count', 'following_count', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('user__username', 'bio')
     
@@ -33,10 +33,16 @@ class UserProfileAdmin(admin.ModelAdmin):
         return obj.bio[:30] + '...' if len(obj.bio) > 30 else obj.bio
     bio_preview.short_description = 'Bio'
 
+class ConversationMemberInline(admin.TabularInline):
+    model = ConversationMember
+    extra = 0
+    readonly_fields = ('last_read_message_id', 'unread_count')
+
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
     list_display = ('id', 'participants_list', 'created_at', 'updated_at')
     list_filter = ('created_at', 'updated_at')
+    inlines = [ConversationMemberInline]
     
     def participants_list(self, obj):
         return ', '.join([user.username for user in obj.participants.all()])
@@ -44,8 +50,8 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('sender', 'conversation', 'content_preview', 'created_at', 'is_read')
-    list_filter = ('created_at', 'is_read')
+    list_display = ('sender', 'conversation', 'content_preview', 'created_at')
+    list_filter = ('created_at',)
     search_fields = ('content', 'sender__username')
     
     def content_preview(self, obj):
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db.models import Q
+
+from .feed import InvalidCursor
+from .models import Message
+
+
+def chat_history_page_size():
+    """Largest number of messages returned per history page"""
+    return getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+
+
+def read_receipt_interval():
+    """Minimum seconds between two read cursor writes of a chat socket"""
+    return getattr(settings, 'CHAT_READ_RECEIPT_INTERVAL', 2)
+
+
+def get_message_page(conversation_id, before_id=None, after_id=None, limit=None):
+    """
+    One page of a conversation's messages, oldest first, and whether more
+    exist beyond it.
+
+    Without a cursor this is the latest page. ``before_id`` pages back into
+    older history and ``after_id`` catches up on newer messages; either way
+    the page is a bounded range scan over the (conversation, created_at, id)
+    index starting at the cursor message.
+    """
+    page_size = chat_history_page_size()
+    limit = min(limit or page_size, page_size)
+    messages = Message.objects.filter(conversation_id=conversation_id).select_related('sender__profile')
+
+    cursor_id = after_id or before_id
+    if cursor_id:
+        created_at = messages.filter(id=cursor_id).values_list('created_at', flat=True).first()
+        if created_at is None:
+            raise InvalidCursor('Unknown message.')
+
+    if after_id:
+        rows = list(
+            messages.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=after_id))
+            .order_by('created_at', 'id')[:limit + 1]
+        )
+        return rows[:limit], len(rows) > limit
+
+    if before_id:
+        messages = messages.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=before_id))
+    rows = list(messages.order_by('-created_at', '-id')[:limit + 1])
+    return rows[:limit][::-1], len(rows) > limit
+
+
+def message_event(message):
+    """A message in the shape ChatConsumer sends it over the socket"""
+    return {
+        'message': message.content,
+        'sender': message.sender.username,
+        'sender_id': message.sender_id,
+        'timestamp': message.created_at.isoformat(),
+        'message_id': message.id,
+    }
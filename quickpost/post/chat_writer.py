@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Conversation, ConversationMember, Message
+
+logger = logging.getLogger(__name__)
+
+
+def batched_writes_enabled():
+    """Whether ChatConsumer persists messages through the MessageBatcher"""
+    return getattr(settings, 'CHAT_BATCHED_WRITES', False)
+
+
+def write_message_batch(pending):
+    """
+    Persist ``(conversation_id, sender, content)`` messages in one
+    transaction and return the saved messages in the same order.
+
+    One bulk INSERT (which returns the new IDs), then per conversation one
+    UPDATE of the members that didn't write in this batch, one per member
+    that did, and one bumping ``updated_at``. The read state ends up as if
+    every message had gone through Conversation.post_message in order.
+    """
+    messages = [
+        Message(conversation_id=conversation_id, sender=sender, content=content)
+        for conversation_id, sender, content in pending
+    ]
+    by_conversation = defaultdict(list)
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        for message in messages:
+            by_conversation[message.conversation_id].append(message)
+
+        for conversation_id, batch in by_conversation.items():
+            members = ConversationMember.objects.filter(conversation_id=conversation_id)
+            # A sender has read up to their own last message, and everything
+            # the others wrote after it is unread for them
+            last_sent = {}
+            for position, message in enumerate(batch):
+                last_sent[message.sender_id] = position
+            members.exclude(user_id__in=list(last_sent)).update(
+                unread_count=F('unread_count') + len(batch)
+            )
+            for sender_id, position in last_sent.items():
+                members.filter(user_id=sender_id).update(
+                    last_read_message_id=batch[position].id,
+                    unread_count=sum(1 for m in batch[position + 1:] if m.sender_id != sender_id),
+                )
+            Conversation.objects.filter(pk=conversation_id).update(updated_at=batch[-1].created_at)
+    return messages
+
+
+class MessageBatcher:
+    """
+    Coalesce chat messages from every socket in the process into one write
+    transaction per flush.
+
+    The first queued message opens a window of CHAT_BATCH_WINDOW_MS; what
+    arrives in that window (up to CHAT_BATCH_MAX_SIZE) is written together
+    and each sender's future resolves to its saved message. The queue is
+    bounded by CHAT_BATCH_QUEUE_SIZE: once it is full, ``submit`` waits, so
+    a flood slows the senders' sockets down instead of growing memory.
+    """
+
+    def __init__(self, window_ms=5, max_size=200, queue_size=5000):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._task = None
+
+    async def submit(self, conversation_id, sender, content):
+        """Queue a message and wait until it is saved"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((conversation_id, sender, content), future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.window
+            while len(batch) < self.max_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            saved = await database_sync_to_async(write_message_batch)([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Error writing a batch of {len(batch)} chat messages: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), message in zip(batch, saved):
+            if not future.done():
+                future.set_result(message)
+
+
+# One batcher per event loop (a worker process normally runs just one)
+_batchers = {}
+
+
+def get_message_batcher():
+    """The batcher of the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _batchers:
+        _batchers[loop] = MessageBatcher(
+            window_ms=getattr(settings, 'CHAT_BATCH_WINDOW_MS', 5),
+            max_size=getattr(settings, 'CHAT_BATCH_MAX_SIZE', 200),
+            queue_size=getattr(settings, 'CHAT_BATCH_QUEUE_SIZE', 5000),
+        )
+    return _batchers[loop]
@@ -1,8 +1,17 @@
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
-from .models import Conversation, Message
+from .chat import get_message_page, message_event, read_receipt_interval
+from .chat_writer import batched_writes_enabled, get_message_batcher
+from .feed import InvalidCursor
+from .models import Conversation, ConversationMember, Message
+from .presence import (
+    mark_absent, mark_present, online_user_ids, presence_heartbeat,
+    typing_interval, typing_ttl,
+)
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -33,7 +42,29 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        # Typing and presence live in the channel layer and the cache only
+        self.typing = False
+        self.typing_sent_at = 0
+        self.stop_typing_task = None
+        self.heartbeat_at = float('-inf')
+        self.read_pending = None
+        self.read_reported = 0
+        self.read_written_at = float('-inf')
+        self.read_flush_task = None
+        await self.heartbeat()
+
     async def disconnect(self, close_code):
+        # Only sockets that got past connect count as present
+        if hasattr(self, 'typing'):
+            self.cancel_stop_typing()
+            await self.stop_typing()
+            if self.read_flush_task is not None:
+                self.read_flush_task.cancel()
+            await self.flush_read_receipt()
+            # Another tab of the same user puts them back on its next heartbeat
+            await mark_absent(self.conversation_id, self.user.id)
+            await self.broadcast_presence(False)
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -44,12 +75,33 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         try:
             text_data_json = json.loads(text_data)
+            if text_data_json.get('type') == 'history':
+                await self.send_history(text_data_json)
+                return
+            if text_data_json.get('type') == 'presence':
+                await self.heartbeat()
+                return
+            if text_data_json.get('type') == 'read':
+                try:
+                    message_id = int(text_data_json['message_id'])
+                except (KeyError, TypeError, ValueError):
+                    await self.send(text_data=json.dumps({'error': 'Invalid message id'}))
+                    return
+                await self.report_read(message_id)
+                return
+            if 'typing' in text_data_json:
+                await self.update_typing(bool(text_data_json['typing']))
+                return
             message_content = text_data_json['message']
             
             # Save message to database
             message = await self.save_message(message_content)
             
             if message:
+                # Receivers hide the indicator when the message arrives
+                self.cancel_stop_typing()
+                self.typing = False
+
                 # Send message to room group
                 await self.channel_layer.group_send(
                     self.room_group_name,
@@ -90,53 +142,196 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'message_id': message_id
         }))
 
-    @database_sync_to_async
-    def check_conversation_participant(self):
-        """Check if current user is a participant in the conversation"""
+    async def typing_update(self, event):
+        if event['sender_id'] != self.user.id:
+            await self.send(text_data=json.dumps({
+                'type': 'typing',
+                'sender_id': event['sender_id'],
+                'typing': event['typing'],
+                'ttl': typing_ttl(),
+            }))
+
+    async def presence_update(self, event):
+        if event['user_id'] != self.user.id:
+            await self.send(text_data=json.dumps({
+                'type': 'presence',
+                'user_id': event['user_id'],
+                'online': event['online'],
+            }))
+
+    async def read_receipt(self, event):
+        if event['user_id'] != self.user.id:
+            await self.send(text_data=json.dumps({
+                'type': 'read',
+                'user_id': event['user_id'],
+                'message_id': event['message_id'],
+            }))
+
+    async def report_read(self, message_id):
+        """
+        Take the highest message the client has seen. The read cursor is
+        written at most once per read receipt interval; reports arriving in
+        between only raise what the next write will store.
+        """
+        if message_id <= self.read_reported:
+            return
+        self.read_reported = self.read_pending = message_id
+        if self.read_flush_task is None:
+            delay = max(0, self.read_written_at + read_receipt_interval() - time.monotonic())
+            self.read_flush_task = asyncio.create_task(self.flush_read_receipt(delay))
+
+    async def flush_read_receipt(self, delay=0):
+        """Write the pending read cursor and tell the room if it moved"""
+        await asyncio.sleep(delay)
+        self.read_flush_task = None
+        message_id, self.read_pending = self.read_pending, None
+        if message_id is None:
+            return
+        self.read_written_at = time.monotonic()
+        message_id = await self.mark_read(message_id)
+        if message_id:
+            await self.channel_layer.group_send(self.room_group_name, {
+                'type': 'read_receipt',
+                'user_id': self.user.id,
+                'message_id': message_id,
+            })
+
+    async def heartbeat(self):
+        """
+        Keep the user online, telling the room only when they weren't, and
+        answer with who else is. Frames closer together than half the
+        heartbeat interval are ignored.
+        """
+        now = time.monotonic()
+        if now - self.heartbeat_at < presence_heartbeat() / 2:
+            return
+        self.heartbeat_at = now
+        if await mark_present(self.conversation_id, self.user.id):
+            await self.broadcast_presence(True)
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'online': await online_user_ids(self.conversation_id, self.participant_ids),
+            'heartbeat': presence_heartbeat(),
+        }))
+
+    async def broadcast_presence(self, online):
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'presence_update',
+            'user_id': self.user.id,
+            'online': online,
+        })
+
+    async def update_typing(self, typing):
+        """
+        Pass a typing frame on to the room, coalesced: starting (or still
+        typing) at most once per typing interval, and stopping only once the
+        pause has lasted a whole interval, so pauses between words don't
+        flicker the indicator.
+        """
+        self.cancel_stop_typing()
+        if typing:
+            now = time.monotonic()
+            if not self.typing or now - self.typing_sent_at >= typing_interval():
+                self.typing, self.typing_sent_at = True, now
+                await self.broadcast_typing(True)
+        elif self.typing:
+            self.stop_typing_task = asyncio.create_task(self.stop_typing(typing_interval()))
+
+    async def stop_typing(self, delay=0):
+        await asyncio.sleep(delay)
+        if self.typing:
+            self.typing = False
+            await self.broadcast_typing(False)
+
+    def cancel_stop_typing(self):
+        if self.stop_typing_task is not None:
+            self.stop_typing_task.cancel()
+            self.stop_typing_task = None
+
+    async def broadcast_typing(self, typing):
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'typing_update',
+            'sender_id': self.user.id,
+            'typing': typing,
+        })
+
+    async def send_history(self, request):
+        """Answer a history frame with one page of messages, to this socket only"""
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return conversation.participants.filter(id=self.user.id).exists()
-        except Conversation.DoesNotExist:
-            return False
+            before_id, after_id, limit = (
+                int(request[name]) if request.get(name) else None
+                for name in ('before_id', 'after_id', 'limit')
+            )
+            page, has_more = await self.get_history(before_id, after_id, limit)
+        except (ValueError, TypeError, InvalidCursor):
+            await self.send(text_data=json.dumps({'error': 'Invalid cursor'}))
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'history',
+            'messages': page,
+            'has_more': has_more,
+        }))
 
     @database_sync_to_async
-    def save_message(self, message_content):
+    def get_history(self, before_id, after_id, limit):
+        page, has_more = get_message_page(self.conversation_id, before_id, after_id, limit)
+        return [message_event(message) for message in page], has_more
+
+    @database_sync_to_async
+    def check_conversation_participant(self):
+        """
+        Check if current user is a participant in the conversation. The
+        participant IDs are kept for the life of the socket, so frames
+        don't need to look the conversation up again.
+        """
+        self.participant_ids = set(
+            ConversationMember.objects.filter(conversation_id=self.conversation_id)
+            .values_list('user_id', flat=True)
+        )
+        self.conversation = Conversation(pk=self.conversation_id)
+        return self.user.id in self.participant_ids
+
+    async def save_message(self, message_content):
         """Save message to database"""
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            
-            # Validate message content
-            if not message_content.strip():
-                return None
-            
-            if len(message_content) > 1000:
-                return None
-            
-            # Create and save message
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=self.user,
-                content=message_content.strip()
-            )
-            
-            # Update conversation's updated_at timestamp
-            conversation.save()
-            
-            return message
-        except Conversation.DoesNotExist:
+        # Validate message content
+        if not message_content.strip():
             return None
-        except Exception:
+        
+        if len(message_content) > 1000:
             return None
 
+        if batched_writes_enabled():
+            # Shares a transaction with whatever else arrives in the window;
+            # waits here while the queue is full
+            try:
+                return await get_message_batcher().submit(
+                    self.conversation_id, self.user, message_content.strip()
+                )
+            except Exception:
+                return None
+        return await self.post_message(message_content.strip())
+
     @database_sync_to_async
-    def mark_messages_as_read(self):
-        """Mark all messages in conversation as read for current user"""
+    def post_message(self, content):
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            # Mark messages as read (exclude messages from current user)
-            conversation.messages.filter(is_read=False).exclude(sender=self.user).update(is_read=True)
-        except Conversation.DoesNotExist:
-            pass
+            # Create the message and bump updated_at in one transaction
+            return self.conversation.post_message(self.user, content)
+        except Exception:
+            return None
+
+    @database_sync_to_async
+    def mark_read(self, message_id):
+        """
+        Move the user's read cursor up to ``message_id``, or rather the
+        latest message at or before it, since the ID comes from the client.
+        Returns the new cursor, or None when it didn't move.
+        """
+        message_id = Message.objects.filter(
+            conversation_id=self.conversation_id, id__lte=message_id
+        ).order_by('-id').values_list('id', flat=True).first()
+        if message_id and self.conversation.mark_read(self.user, message_id):
+            return message_id
+        return None
 
 
 class NotificationConsumer(AsyncWebsocketConsumer):
@@ -0,0 +1,251 @@
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Comment, Post, Reaction
+from .reaction_index import get_reaction_index
+from .reactions import get_reaction_buffer
+
+
+def feed_page_size():
+    """Number of posts per feed page"""
+    return getattr(settings, 'FEED_PAGE_SIZE', 20)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row on a page into an opaque string"""
+    # str() keeps full microsecond precision on datetimes, which the keyset
+    # comparison needs (DjangoJSONEncoder would truncate to milliseconds)
+    payload = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, output_field=None):
+    """
+    Decode a cursor produced by encode_cursor back into its sort key. The
+    sort value is converted with ``output_field`` (the model field or
+    annotation sorted on), so a tampered cursor is rejected here instead
+    of failing inside the query.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != 2:
+        raise InvalidCursor('Invalid cursor.')
+    value, last_id = values
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise InvalidCursor('Invalid cursor.')
+    if output_field is not None:
+        try:
+            value = output_field.to_python(value)
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor('Invalid cursor.')
+        if value is None:
+            raise InvalidCursor('Invalid cursor.')
+        if isinstance(value, datetime) and settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+    return [value, last_id]
+
+
+def sort_field(queryset, field):
+    """The model field or annotation ``queryset`` is sorted on as ``field``"""
+    annotation = queryset.query.annotations.get(field)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(field)
+
+
+def keyset_filter(queryset, cursor=None, field='created_at', tiebreak='id', descending=True):
+    """
+    Order ``queryset`` by ``(field, tiebreak)``, newest first unless
+    ``descending`` is False, and, given a cursor, keep only the rows that
+    come after it.
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{field}', f'-{tiebreak}')
+        lookup = 'lt'
+    else:
+        queryset = queryset.order_by(field, tiebreak)
+        lookup = 'gt'
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_field(queryset, field))
+        queryset = queryset.filter(
+            Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'{tiebreak}__{lookup}': last_id})
+        )
+    return queryset
+
+
+def paginate(queryset, cursor=None, page_size=None, field='created_at', descending=True):
+    """
+    Return one page of ``queryset`` ordered newest first by ``(field, id)``
+    (oldest first if ``descending`` is False) together with the cursor for
+    the next page (None on the last page).
+
+    The page is located with a keyset filter instead of OFFSET, so its cost
+    does not depend on how deep into the feed the reader has scrolled.
+    """
+    page_size = page_size or feed_page_size()
+    queryset = keyset_filter(queryset, cursor, field, descending=descending)
+
+    # Fetch one extra row to find out whether another page exists
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field), last.id])
+    return rows, next_cursor
+
+
+def feed_queryset():
+    """Posts with their authors and author profiles fetched up front"""
+    return Post.objects.select_related('user', 'user__profile')
+
+
+def attach_comment_previews(posts, size=None):
+    """
+    Set ``comment_preview`` on every post to its latest ``size`` comments
+    (FEED_COMMENT_PREVIEW by default), oldest first, fetched for the whole
+    page in one query. The rest of a thread is loaded on demand.
+    """
+    if size is None:
+        size = getattr(settings, 'FEED_COMMENT_PREVIEW', 2)
+    previews = {post.id: [] for post in posts}
+    if size and previews:
+        latest = Comment.objects.filter(post_id__in=list(previews)).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F('post_id')],
+                order_by=[F('created_at').desc(), F('id').desc()],
+            )
+        ).filter(position__lte=size).select_related('user', 'user__profile')
+        for comment in latest.order_by('created_at', 'id'):
+            previews[comment.post_id].append(comment)
+
+    for post in posts:
+        post.comment_preview = previews[post.id]
+    return posts
+
+
+def get_comments_page(post, cursor=None, page_size=None):
+    """Get one page of a post's comments, oldest first"""
+    page_size = page_size or getattr(settings, 'COMMENTS_PAGE_SIZE', 20)
+    return paginate(
+        post.comments.select_related('user', 'user__profile'),
+        cursor, page_size, descending=False,
+    )
+
+
+def attach_viewer_state(posts, viewer):
+    """
+    Set ``viewer_liked``/``viewer_disliked`` on every post from the
+    viewer's cached reaction index instead of a membership test per card.
+    Toggles still sitting in the reaction buffer take precedence.
+    """
+    liked, disliked = set(), set()
+    if viewer is not None and viewer.is_authenticated and posts:
+        post_ids = [post.id for post in posts]
+        kinds = get_reaction_index(viewer.id).kinds_of(post_ids)
+        buffer = get_reaction_buffer()
+        if buffer is not None:
+            kinds.update(buffer.buffered_kinds(viewer.id, post_ids))
+        for post_id, kind in kinds.items():
+            if kind:
+                (liked if kind == Reaction.LIKE else disliked).add(post_id)
+
+    for post in posts:
+        post.viewer_liked = post.id in liked
+        post.viewer_disliked = post.id in disliked
+    return posts
+
+
+def get_feed_page(viewer=None, cursor=None, page_size=None):
+    """Get one page of the public feed, ready to render for ``viewer``"""
+    posts, next_cursor = paginate(feed_queryset(), cursor, page_size)
+    return attach_viewer_state(posts, viewer), next_cursor
+
+
+def top_feed_max_posts():
+    """Number of posts ranked into one Top feed snapshot"""
+    return getattr(settings, 'TOP_FEED_MAX_POSTS', 1000)
+
+
+def top_feed_snapshot_timeout():
+    """Seconds a reader can keep paging through one Top feed snapshot"""
+    return getattr(settings, 'TOP_FEED_SNAPSHOT_TIMEOUT', 1800)
+
+
+def get_top_page(viewer=None, cursor=None, page_size=None):
+    """
+    Get one page of the Top feed: posts from the ranking window ordered by
+    their stored ``rank_score``, read straight off the score index.
+
+    Scores move with every reaction and re-decay, so keyset paging on them
+    would repeat or skip posts. The first page snapshots the ranked IDs in
+    the cache instead and the cursor is a position in that snapshot, which
+    keeps the order fixed while one reader pages through it.
+    """
+    page_size = page_size or feed_page_size()
+    if cursor:
+        key, offset = decode_cursor(cursor)
+        ranked = cache.get(key) if isinstance(key, str) and key.startswith('top_feed:') else None
+        if ranked is None or offset < 0:
+            raise InvalidCursor('Invalid cursor.')
+    else:
+        ranked = list(
+            Post.objects.filter(rank_score__gt=0).order_by('-rank_score', '-id')
+            .values_list('id', flat=True)[:top_feed_max_posts()]
+        )
+        key, offset = f'top_feed:{uuid.uuid4().hex}', 0
+        if len(ranked) > page_size:
+            cache.set(key, ranked, top_feed_snapshot_timeout())
+
+    page_ids = ranked[offset:offset + page_size]
+    next_cursor = None
+    if offset + page_size < len(ranked):
+        next_cursor = encode_cursor([key, offset + page_size])
+
+    posts_by_id = feed_queryset().in_bulk(page_ids)
+    # Posts deleted since the snapshot are skipped
+    posts = [posts_by_id[post_id] for post_id in page_ids if post_id in posts_by_id]
+    return attach_viewer_state(posts, viewer), next_cursor
+
+
+def redecay_rank_scores(batch_size=500):
+    """
+    Recompute ``rank_score`` for every post in the ranking window so that
+    scores keep decaying between reactions, and zero the posts that have
+    aged out of it. Returns the number of posts updated.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(hours=getattr(settings, 'RANK_WINDOW_HOURS', 24))
+    recent = Post.objects.filter(created_at__gte=cutoff).only(
+        'id', 'created_at', *Post.COUNTER_FIELDS
+    ).order_by('id')
+
+    updated, batch = 0, []
+    for post in recent.iterator(chunk_size=batch_size):
+        post.rank_score = post.compute_rank_score(now)
+        batch.append(post)
+        if len(batch) >= batch_size:
+            updated += Post.objects.bulk_update(batch, ['rank_score'])
+            batch = []
+    if batch:
+        updated += Post.objects.bulk_update(batch, ['rank_score'])
+
+    updated += Post.objects.filter(created_at__lt=cutoff, rank_score__gt=0).update(rank_score=0)
+    return updated
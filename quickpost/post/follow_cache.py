@@ -0,0 +1,126 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import UserProfile
+
+
+def follow_cache_enabled():
+    """Whether follow checks are answered from the in-process cache"""
+    return getattr(settings, 'FOLLOW_CACHE_ENABLED', False)
+
+
+def follow_cache_max_users():
+    """Followee lists kept per process before the least recently used goes"""
+    return getattr(settings, 'FOLLOW_CACHE_MAX_USERS', 10000)
+
+
+def follow_cache_recheck_interval():
+    """Seconds a cached followee list is trusted before its version is checked again"""
+    return getattr(settings, 'FOLLOW_CACHE_RECHECK_INTERVAL', 1.0)
+
+
+def version_key(profile_id):
+    return f'follow_version:{profile_id}'
+
+
+class FollowCache:
+    """
+    Process-local LRU of sorted followee-ID arrays, one per profile.
+
+    Each entry remembers the version it was loaded at. The version lives in
+    the shared Django cache and is replaced on every follow/unfollow. An
+    entry is answered from memory alone for FOLLOW_CACHE_RECHECK_INTERVAL
+    seconds, after that the next lookup compares versions (one cache fetch)
+    and reloads when they differ. Changes made in this process drop the
+    entry straight away, other processes see them within the interval.
+    """
+
+    def __init__(self, max_users, recheck_interval=None):
+        self.max_users = max_users
+        self.recheck_interval = recheck_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def followee_ids(self, profile_id):
+        """Sorted array of the profile IDs ``profile_id`` follows"""
+        interval = self.recheck_interval
+        if interval is None:
+            interval = follow_cache_recheck_interval()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(profile_id)
+            if entry is not None and now - entry[2] < interval:
+                self._entries.move_to_end(profile_id)
+                return entry[1]
+
+        version = cache.get_or_set(version_key(profile_id), time.time_ns, None)
+        with self._lock:
+            entry = self._entries.get(profile_id)
+            if entry is not None and entry[0] == version:
+                self._entries[profile_id] = (version, entry[1], now)
+                self._entries.move_to_end(profile_id)
+                return entry[1]
+
+        ids = array('q', UserProfile.following.through.objects.filter(
+            from_userprofile_id=profile_id
+        ).order_by('to_userprofile_id').values_list('to_userprofile_id', flat=True))
+        with self._lock:
+            self._entries[profile_id] = (version, ids, now)
+            self._entries.move_to_end(profile_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return ids
+
+    def is_following(self, profile_id, other_id):
+        ids = self.followee_ids(profile_id)
+        i = bisect_left(ids, other_id)
+        return i < len(ids) and ids[i] == other_id
+
+    def stats(self):
+        """Memory held by the cache, in bytes, in total and per cached profile"""
+        with self._lock:
+            per_user = {
+                profile_id: sys.getsizeof(ids)
+                for profile_id, (_, ids, _) in self._entries.items()
+            }
+        return {
+            'users': len(per_user),
+            'max_users': self.max_users,
+            'bytes': sum(per_user.values()),
+            'per_user': per_user,
+        }
+
+    def discard(self, profile_id):
+        with self._lock:
+            self._entries.pop(profile_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+follow_cache = FollowCache(follow_cache_max_users())
+
+
+def invalidate_followees(profile_id):
+    """
+    Give ``profile_id`` a new version so every process reloads its
+    followees, and drop this process's copy. Done again on commit, in case
+    another request reloaded the old rows in between.
+    """
+    key = version_key(profile_id)
+
+    def bump():
+        cache.set(key, time.time_ns(), None)
+        follow_cache.discard(profile_id)
+
+    bump()
+    transaction.on_commit(bump)
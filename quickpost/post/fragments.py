@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.timesince import timesince
+
+from .feed import attach_comment_previews
+
+# Markers left in the cached card HTML where viewer-specific or
+# time-dependent content is filled in on every request
+LIKED_SLOT = '<!--slot:liked-->'
+MENU_SLOT = '<!--slot:menu-->'
+TIMESINCE_SLOT = '<!--slot:timesince-->'
+COMMENT_FORM_SLOT = '<!--slot:comment-form-->'
+POST_ID_SLOT = '__POST_ID__'
+
+CARD_TEMPLATES = {
+    'feed': 'post_card.html',
+    'preview': 'post_preview_card.html',
+}
+MENU_TEMPLATES = {
+    'feed': 'post_card_menu.html',
+    'preview': 'post_preview_actions.html',
+}
+
+
+def card_cache_key(post, variant='feed'):
+    """
+    Cache key of a rendered card. It changes whenever the post's version is
+    bumped (edit, reaction, comment) or its author updates their profile.
+    """
+    profile_stamp = post.user.profile.updated_at.timestamp()
+    return f'post_card:{variant}:{post.id}:{post.version}:{profile_stamp}'
+
+
+def render_post_cards(posts, request, variant='feed'):
+    """
+    Render post cards for ``request.user``.
+
+    The shared part of each card comes from the cache in one ``get_many``,
+    only missing cards go through the template engine. The liked state,
+    owner menu, comment form and relative time are then spliced into the
+    cached HTML per request.
+    """
+    keys = {post.id: card_cache_key(post, variant) for post in posts}
+    cards = cache.get_many(list(keys.values()))
+
+    missing = [post for post in posts if keys[post.id] not in cards]
+    if missing:
+        if variant == 'feed':
+            attach_comment_previews(missing)
+        rendered = {
+            keys[post.id]: render_to_string(CARD_TEMPLATES[variant], {'post': post})
+            for post in missing
+        }
+        cache.set_many(rendered, getattr(settings, 'POST_CARD_CACHE_TIMEOUT', 300))
+        cards.update(rendered)
+
+    viewer = request.user
+    comment_form = ''
+    if variant == 'feed' and viewer.is_authenticated:
+        comment_form = render_to_string(
+            'post_card_comment_form.html', {'post_id': POST_ID_SLOT}, request=request
+        )
+
+    html = []
+    for post in posts:
+        card = cards[keys[post.id]]
+        menu = ''
+        if viewer.is_authenticated and viewer.id == post.user_id:
+            menu = render_to_string(MENU_TEMPLATES[variant], {'post': post})
+        card = (
+            card.replace(LIKED_SLOT, 'liked' if getattr(post, 'viewer_liked', False) else '')
+            .replace(TIMESINCE_SLOT, timesince(post.created_at))
+            .replace(MENU_SLOT, menu)
+            .replace(COMMENT_FORM_SLOT, comment_form.replace(POST_ID_SLOT, str(post.id)))
+        )
+        html.append(card)
+    return mark_safe(''.join(html))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+
+class ReconcileCommand(BaseCommand):
+    """
+    Walk ``model`` in id batches, find rows whose denormalized counters
+    disagree with ``true_counts()`` and recompute them
+    """
+    model = None
+    noun = 'rows'
+
+    def true_counts(self):
+        """Expressions computing each counter column from the source tables"""
+        raise NotImplementedError
+
+    def repair(self, ids):
+        """
+        Recompute the counters of ``ids``. The expressions are evaluated
+        inside the UPDATE itself so writes that land between the check and
+        the fix are not overwritten.
+        """
+        self.model.objects.filter(id__in=ids).update(**self.true_counts())
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help=f'Number of {self.noun} checked per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help=f'Report drifted {self.noun} without fixing them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = repaired = 0
+        last_id = 0
+
+        while True:
+            batch = list(
+                self.model.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            expected = self.true_counts()
+            drift = Q()
+            for name in expected:
+                drift |= ~Q(**{name: F(f'true_{name}')})
+            drifted = list(
+                self.model.objects.filter(id__in=batch)
+                .annotate(**{f'true_{name}': expr for name, expr in expected.items()})
+                .filter(drift)
+                .values_list('id', flat=True)
+            )
+            checked += len(batch)
+
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    self.repair(drifted)
+            repaired += len(drifted)
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} {self.noun}. {verb} {repaired} with drifted counters.'
+        ))
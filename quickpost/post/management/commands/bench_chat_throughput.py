@@ -0,0 +1,67 @@
+import asyncio
+import statistics
+import time
+
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from post.chat_writer import MessageBatcher
+from post.models import Conversation
+
+from .bench_chat_write import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Sustained chat messages/second with one transaction per message "
+        "versus micro-batched writes, with many sockets sending at once. "
+        "Writes and then deletes a throwaway conversation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=50)
+        parser.add_argument('--messages', type=int, default=40, help="Messages per sender")
+        parser.add_argument('--window-ms', type=float, default=5)
+        parser.add_argument('--max-size', type=int, default=200)
+        parser.add_argument('--queue-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        senders = [User.objects.create_user(f'bench_throughput_{i}') for i in range(options['senders'])]
+        conversation = Conversation.objects.create()
+        try:
+            conversation.participants.add(*senders)
+            asyncio.run(self.compare(conversation, senders, options))
+        finally:
+            User.objects.filter(id__in=[sender.id for sender in senders]).delete()
+            Conversation.objects.filter(id=conversation.id).delete()
+
+    async def compare(self, conversation, senders, options):
+        cached = Conversation(pk=conversation.id)
+
+        async def direct(sender, content):
+            # What ChatConsumer does per frame without batching
+            return await database_sync_to_async(cached.post_message)(sender, content)
+
+        batcher = MessageBatcher(options['window_ms'], options['max_size'], options['queue_size'])
+
+        async def batched(sender, content):
+            return await batcher.submit(conversation.id, sender, content)
+
+        for label, save in (('direct', direct), ('batched', batched)):
+            timings = []
+
+            async def socket(sender):
+                for i in range(options['messages']):
+                    began = time.perf_counter()
+                    await save(sender, f'Message {i} from {sender.username}')
+                    timings.append((time.perf_counter() - began) * 1000)
+
+            began = time.perf_counter()
+            await asyncio.gather(*(socket(sender) for sender in senders))
+            elapsed = time.perf_counter() - began
+            self.stdout.write(
+                f"{label:>7}: {len(timings) / elapsed:8.0f} msgs/s, "
+                f"mean {statistics.mean(timings):7.2f}ms "
+                f"p50 {percentile(timings, 50):7.2f}ms p99 {percentile(timings, 99):7.2f}ms"
+            )
@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from post.models import Conversation, ConversationMember, Message
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def transactions_in(captured):
+    """Transactions among captured statements, counting autocommit ones singly"""
+    count, inside = 0, False
+    for query in captured:
+        if query['sql'] == 'BEGIN':
+            count, inside = count + 1, True
+        elif query['sql'] == 'COMMIT':
+            inside = False
+        elif not inside:
+            count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ChatConsumer's per-message database work before and after "
+        "caching the conversation: round-trips and latency. Writes and then "
+        "deletes a throwaway conversation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # Not wrapped in a transaction: the commits are part of what is measured
+        sender = User.objects.create_user('bench_chat_sender')
+        other = User.objects.create_user('bench_chat_other')
+        try:
+            conversation = Conversation.objects.create()
+            conversation.participants.add(sender, other)
+            self.compare(conversation, sender, options['messages'])
+        finally:
+            User.objects.filter(id__in=[sender.id, other.id]).delete()
+            Conversation.objects.filter(id=conversation.id).delete()
+
+    def compare(self, conversation, sender, count):
+        def before(content):
+            # What save_message did per frame: look the conversation up, write
+            # the message and read state, then rewrite the whole row in a
+            # second transaction to bump updated_at
+            current = Conversation.objects.get(id=conversation.id)
+            with transaction.atomic():
+                message = Message.objects.create(conversation=current, sender=sender, content=content)
+                current.memberships.exclude(user=sender).update(unread_count=F('unread_count') + 1)
+                current.memberships.filter(user=sender).update(last_read_message_id=message.id, unread_count=0)
+            current.save()
+            return message
+
+        # Looked up once at connect and kept for the socket's lifetime
+        participant_ids = set(
+            ConversationMember.objects.filter(conversation_id=conversation.id)
+            .values_list('user_id', flat=True)
+        )
+        cached = Conversation(pk=conversation.id)
+
+        def after(content):
+            assert sender.id in participant_ids
+            return cached.post_message(sender, content)
+
+        for label, save in (('before', before), ('after', after)):
+            timings, queries, commits = [], [], []
+            for i in range(count):
+                with CaptureQueriesContext(connection) as captured:
+                    began = time.perf_counter()
+                    save(f'Message {i}')
+                    timings.append((time.perf_counter() - began) * 1000)
+                queries.append(len(captured))
+                commits.append(transactions_in(captured))
+            self.stdout.write(
+                f"{label:>6}: {statistics.mean(queries):4.1f} statements and "
+                f"{statistics.mean(commits):3.1f} transactions/message, "
+                f"p50 {percentile(timings, 50):6.3f}ms p99 {percentile(timings, 99):6.3f}ms"
+            )
@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from post.models import Comment, Post
+
+
+def walk_replies(comment, out):
+    """Depth-first traversal one get_replies() query per node, as before"""
+    out.append(comment)
+    for reply in comment.get_replies().order_by('created_at', 'id'):
+        walk_replies(reply, out)
+    return out
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare fetching deep and wide comment threads node by node against '
+        'a single materialized-path query. Runs in a rolled back transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=Comment.MAX_DEPTH,
+                            help='Length of the reply chain in the deep thread')
+        parser.add_argument('--width', type=int, default=50,
+                            help='Direct replies to the root of the wide thread')
+        parser.add_argument('--fanout', type=int, default=10,
+                            help='Replies to each direct reply in the wide thread')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user('bench_comment_tree')
+            post = Post.objects.create(user=user, content='Benchmark thread')
+
+            deep_root = parent = Comment.objects.create(post=post, user=user, content='deep')
+            for _ in range(options['depth'] - 1):
+                parent = Comment.objects.create(post=post, user=user, content='deep', parent=parent)
+
+            wide_root = Comment.objects.create(post=post, user=user, content='wide')
+            for _ in range(options['width']):
+                reply = Comment.objects.create(post=post, user=user, content='wide', parent=wide_root)
+                for _ in range(options['fanout']):
+                    Comment.objects.create(post=post, user=user, content='wide', parent=reply)
+
+            for label, root in (('deep', deep_root), ('wide', wide_root)):
+                root.refresh_from_db()
+                self.compare(label, root, options['repeat'])
+
+            transaction.set_rollback(True)
+
+    def compare(self, label, root, repeat):
+        results = {}
+        for name, fetch in (
+            ('per-node', lambda: walk_replies(root, [])),
+            ('path', lambda: list(root.get_thread())),
+        ):
+            timings = []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    began = time.perf_counter()
+                    nodes = fetch()
+                    timings.append((time.perf_counter() - began) * 1000)
+            results[name] = [node.id for node in nodes]
+            self.stdout.write(
+                f"{label:>4} {name:>8}: {len(nodes):5d} nodes, {len(queries):5d} queries, "
+                f"best {min(timings):8.2f}ms"
+            )
+        if results['per-node'] != results['path']:
+            self.stderr.write(f'{label}: traversal orders differ')
@@ -0,0 +1,82 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from post.models import Post, Reaction
+from post.reaction_index import get_reaction_index, reaction_index_key
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare resolving which posts of a feed page a viewer reacted to with '
+        'per-post membership queries, one IN query and the cached reaction '
+        'index. Runs in a rolled back transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--reacted', type=float, default=0.2,
+                            help='Fraction of the posts the viewer reacted to')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            author = User.objects.create_user('bench_reaction_author')
+            viewer = User.objects.create_user('bench_reaction_viewer')
+            posts = Post.objects.bulk_create(
+                Post(user=author, content='Benchmark post') for _ in range(options['posts'])
+            )
+            Reaction.objects.bulk_create(
+                Reaction(post=post, user=viewer, kind=rng.choice([Reaction.LIKE, Reaction.DISLIKE]))
+                for post in posts if rng.random() < options['reacted']
+            )
+            cache.delete(reaction_index_key(viewer.id))
+            page = rng.sample(posts, min(options['page_size'], len(posts)))
+            page_ids = [post.id for post in page]
+
+            def per_post():
+                kinds = {}
+                for post in page:
+                    if post.is_liked_by(viewer):
+                        kinds[post.id] = Reaction.LIKE
+                    elif post.is_disliked_by(viewer):
+                        kinds[post.id] = Reaction.DISLIKE
+                return kinds
+
+            def in_query():
+                return dict(Reaction.objects.filter(user_id=viewer.id, post_id__in=page_ids)
+                            .values_list('post_id', 'kind'))
+
+            def index():
+                return get_reaction_index(viewer.id).kinds_of(page_ids)
+
+            results = {}
+            for name, lookup in (('per-post', per_post), ('in-query', in_query),
+                                 ('index', index)):
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        began = time.perf_counter()
+                        results[name] = lookup()
+                        timings.append((time.perf_counter() - began) * 1000)
+                self.stdout.write(
+                    f"{name:>8}: {len(queries):4d} queries, best {min(timings):8.3f}ms, "
+                    f"first {timings[0]:8.3f}ms"
+                )
+
+            cached = get_reaction_index(viewer.id)
+            index_size = sum(len(ids) * ids.itemsize for ids in (cached.liked, cached.disliked))
+            self.stdout.write(f"index size {index_size} bytes")
+            if not results['per-post'] == results['in-query'] == results['index']:
+                self.stderr.write('lookups disagree')
+
+            cache.delete(reaction_index_key(viewer.id))
+            transaction.set_rollback(True)
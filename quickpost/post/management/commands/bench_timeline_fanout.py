@@ -0,0 +1,118 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from post.feed import encode_cursor
+from post.models import Post
+from post.timeline import pulled_posts
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Model timeline fan-out over a skewed (Zipf) follower distribution and '
+        'compare the write amplification of push vs hybrid, timing the hybrid '
+        'read-time pull query against real posts. Runs in a rolled back transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--follows-per-user', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Zipf exponent of account popularity')
+        parser.add_argument('--threshold', type=int, action='append',
+                            help='Follower limit(s) to evaluate, may be repeated')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--reads', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = options['users']
+        thresholds = options['threshold'] or [10, 100, 500]
+
+        # Everyone follows a fixed number of accounts picked by Zipf popularity
+        weights = [1 / (rank + 1) ** options['alpha'] for rank in range(users)]
+        following = []
+        followers = [0] * users
+        for user in range(users):
+            followees = set(rng.choices(range(users), weights=weights, k=options['follows_per_user']))
+            followees.discard(user)
+            following.append(followees)
+            for followee in followees:
+                followers[followee] += 1
+
+        authors = [rng.randrange(users) for _ in range(options['posts'])]
+        self.stdout.write(
+            f"{users} users, max followers {max(followers)}, "
+            f"median followers {statistics.median(followers)}"
+        )
+        pushed_writes = [followers[author] + 1 for author in authors]
+        self.report('push', pushed_writes, [0], [0.0], [0.0])
+
+        with transaction.atomic():
+            user_ids = self.create_posts(authors, users, rng)
+            readers = [rng.randrange(users) for _ in range(options['reads'])]
+            for threshold in thresholds:
+                writes = [
+                    followers[author] + 1 if followers[author] <= threshold else 1
+                    for author in authors
+                ]
+                streams, first_pages, next_pages = [], [], []
+                for reader in readers:
+                    pulled = [user_ids[f] for f in following[reader] if followers[f] > threshold]
+                    streams.append(len(pulled))
+                    if pulled:
+                        page, took = self.time_pull(pulled, None, options['page_size'])
+                        first_pages.append(took)
+                        if len(page) > options['page_size']:
+                            cursor = encode_cursor(list(page[options['page_size'] - 1]))
+                            next_pages.append(self.time_pull(pulled, cursor, options['page_size'])[1])
+                self.report(f'hybrid@{threshold}', writes, streams, first_pages or [0.0], next_pages or [0.0])
+
+            sample = [user_ids[f] for f in following[readers[0]]]
+            self.stdout.write('pull query plan: ' + pulled_posts(sample, None, options['page_size']).explain())
+            transaction.set_rollback(True)
+
+    def create_posts(self, authors, users, rng):
+        """Users and posts spread over the last week; returns user ids by rank"""
+        created = User.objects.bulk_create(
+            User(username=f'bench_timeline_{i}', password='!') for i in range(users)
+        )
+        user_ids = [user.id for user in created]
+        now = timezone.now()
+        posts = Post.objects.bulk_create(
+            (Post(user_id=user_ids[author], content='Benchmark post') for author in authors),
+            batch_size=1000,
+        )
+        for post in posts:
+            post.created_at = now - timedelta(seconds=rng.randrange(7 * 86400))
+        Post.objects.bulk_update(posts, ['created_at'], batch_size=1000)
+        return user_ids
+
+    def time_pull(self, author_ids, cursor, page_size):
+        began = time.perf_counter()
+        page = list(pulled_posts(author_ids, cursor, page_size))
+        return page, (time.perf_counter() - began) * 1000
+
+    def report(self, label, writes, streams, first_pages, next_pages):
+        self.stdout.write(
+            f"{label:>12}: writes/post mean {statistics.mean(writes):8.1f} "
+            f"p99 {percentile(writes, 99):6d} max {max(writes):6d} | "
+            f"pulled authors/read p50 {percentile(streams, 50):3d} "
+            f"p99 {percentile(streams, 99):3d} | "
+            f"pull query p50 {percentile(first_pages, 50):6.2f}ms "
+            f"p99 {percentile(first_pages, 99):6.2f}ms, "
+            f"next page p99 {percentile(next_pages, 99):6.2f}ms"
+        )
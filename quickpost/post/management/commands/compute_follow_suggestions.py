@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from post.models import UserProfile
+from post.suggestions import FollowGraph, compute_suggestions, np
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute "who to follow" suggestions from mutual follows. By default '
+        'only profiles whose neighbourhood changed (or that have none yet).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every profile, not only stale ones')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Profiles written per transaction')
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+        graph = FollowGraph.load()
+        self.stdout.write(
+            f"Loaded {len(graph.profile_ids)} profiles and {len(graph.indices)} follows "
+            f"in {time.perf_counter() - began:.2f}s ({'NumPy' if np is not None else 'pure Python'})"
+        )
+
+        profile_ids = None
+        if options['all']:
+            profile_ids = list(UserProfile.objects.values_list('id', flat=True))
+        began = time.perf_counter()
+        computed = compute_suggestions(profile_ids, graph=graph, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed suggestions for {computed} profiles in {time.perf_counter() - began:.2f}s.'
+        ))
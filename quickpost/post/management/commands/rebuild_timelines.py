@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from post.models import TimelineEntry, UserProfile
+from post.timeline import backfill_timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild home timelines from the follow graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the timeline of this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        rebuilt = 0
+        for user in users.iterator():
+            TimelineEntry.objects.filter(owner=user).delete()
+            backfill_timeline(user.id, user.id)
+            followee_ids = UserProfile.following.through.objects.filter(
+                from_userprofile__user_id=user.id
+            ).values_list('to_userprofile__user_id', flat=True)
+            for author_id in followee_ids:
+                backfill_timeline(user.id, author_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines.'))
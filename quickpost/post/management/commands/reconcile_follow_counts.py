@@ -0,0 +1,32 @@
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from post.models import UserProfile
+
+from ._reconcile import ReconcileCommand
+
+
+def count_of(column):
+    """Correlated COUNT(*) of follow rows whose ``column`` is the outer profile"""
+    follows = UserProfile.following.through.objects.filter(**{column: OuterRef('pk')})
+    return Coalesce(
+        Subquery(follows.order_by().values(column).annotate(n=Count('*')).values('n')),
+        Value(0),
+    )
+
+
+def true_counts():
+    """Expressions computing each counter column from the follow table"""
+    return {
+        'followers_count': count_of('to_userprofile'),
+        'following_count': count_of('from_userprofile'),
+    }
+
+
+class Command(ReconcileCommand):
+    help = 'Repair drift in the denormalized follower/following counters on UserProfile'
+    model = UserProfile
+    noun = 'profiles'
+
+    def true_counts(self):
+        return true_counts()
@@ -0,0 +1,38 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from post.models import Comment, Post, Reaction
+
+from ._reconcile import ReconcileCommand
+
+
+def count_of(queryset):
+    """Correlated COUNT(*) of ``queryset`` rows belonging to the outer post"""
+    return Coalesce(
+        Subquery(queryset.filter(post_id=OuterRef('pk')).order_by()
+                 .values('post_id').annotate(n=Count('*')).values('n')),
+        Value(0),
+    )
+
+
+def true_counts():
+    """Expressions computing each counter column from the source tables"""
+    return {
+        'likes_count': count_of(Reaction.objects.filter(kind=Reaction.LIKE)),
+        'dislikes_count': count_of(Reaction.objects.filter(kind=Reaction.DISLIKE)),
+        'comments_count': count_of(Comment.objects.all()),
+    }
+
+
+class Command(ReconcileCommand):
+    help = 'Repair drift in the denormalized like/dislike/comment counters on Post'
+    model = Post
+    noun = 'posts'
+
+    def true_counts(self):
+        return true_counts()
+
+    def repair(self, ids):
+        # New counters change the rendered card and the Top ranking too
+        Post.objects.filter(id__in=ids).update(version=F('version') + 1, **true_counts())
+        Post._refresh_rank_scores(ids)
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _segment(comment_id):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    segment = ''
+    while comment_id:
+        comment_id, remainder = divmod(comment_id, 36)
+        segment = digits[remainder] + segment
+    return segment.rjust(8, '0')
+
+
+def populate_paths(apps, schema_editor):
+    Comment = apps.get_model('post', 'Comment')
+    # Parents are always older than their replies, so id order is enough
+    paths, depths, replies = {}, {}, {}
+    for comment_id, parent_id in Comment.objects.order_by('id').values_list('id', 'parent_id'):
+        paths[comment_id] = paths.get(parent_id, '') + _segment(comment_id)
+        depths[comment_id] = depths[parent_id] + 1 if parent_id else 0
+        if parent_id:
+            replies[parent_id] = replies.get(parent_id, 0) + 1
+
+    batch = []
+    for comment in Comment.objects.order_by('id').only('id').iterator():
+        comment.path = paths[comment.id]
+        comment.depth = depths[comment.id]
+        comment.reply_count = replies.get(comment.id, 0)
+        batch.append(comment)
+    Comment.objects.bulk_update(batch, ['path', 'depth', 'reply_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0017_comment_post_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=400),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def copy_reactions(apps, schema_editor):
+    Post = apps.get_model('post', 'Post')
+    Reaction = apps.get_model('post', 'Reaction')
+    # The old like view didn't clear dislikes, so a user can have both.
+    # Keep the like in that case.
+    liked = set(Post.likes.through.objects.values_list('post_id', 'user_id'))
+    disliked = set(Post.dislikes.through.objects.values_list('post_id', 'user_id')) - liked
+    Reaction.objects.bulk_create(
+        [Reaction(post_id=post_id, user_id=user_id, kind='like') for post_id, user_id in liked]
+        + [Reaction(post_id=post_id, user_id=user_id, kind='dislike') for post_id, user_id in disliked],
+        batch_size=500,
+    )
+
+    def count(kind):
+        return Coalesce(
+            Subquery(Reaction.objects.filter(post_id=OuterRef('pk'), kind=kind).order_by()
+                     .values('post_id').annotate(n=Count('*')).values('n')),
+            Value(0),
+        )
+
+    Post.objects.update(likes_count=count('like'), dislikes_count=count('dislike'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0018_comment_materialized_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('like', 'Like'), ('dislike', 'Dislike')], max_length=7)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='post.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'post'], name='reaction_user_post_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'user'), name='unique_reaction')],
+            },
+        ),
+        migrations.RunPython(copy_reactions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='post',
+            name='dislikes',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='likes',
+        ),
+    ]
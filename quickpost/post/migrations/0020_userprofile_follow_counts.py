@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, column):
+    return Coalesce(
+        Subquery(queryset.filter(**{column: OuterRef('pk')}).order_by()
+                 .values(column).annotate(n=Count('*')).values('n')),
+        Value(0),
+    )
+
+
+def populate_counts(apps, schema_editor):
+    UserProfile = apps.get_model('post', 'UserProfile')
+    follows = UserProfile.following.through.objects.all()
+    UserProfile.objects.update(
+        followers_count=_count(follows, 'to_userprofile'),
+        following_count=_count(follows, 'from_userprofile'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0019_reaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0020_userprofile_follow_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('suggestions', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('stale', models.BooleanField(default=False)),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='follow_suggestion', to='post.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stale'], name='followsuggestion_stale_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_read_state(apps, schema_editor):
+    ConversationMember = apps.get_model('post', 'ConversationMember')
+    Message = apps.get_model('post', 'Message')
+
+    # Everything the member sent or was marked read counts as seen
+    seen = Message.objects.filter(conversation=OuterRef('conversation')).filter(
+        Q(sender=OuterRef('user')) | Q(is_read=True)
+    ).order_by().values('conversation').annotate(last=Max('id')).values('last')
+    unread = Message.objects.filter(
+        conversation=OuterRef('conversation'), is_read=False
+    ).exclude(sender=OuterRef('user')).order_by().values('conversation').annotate(
+        n=Count('*')
+    ).values('n')
+    ConversationMember.objects.update(
+        last_read_message_id=Coalesce(Subquery(seen), Value(0)),
+        unread_count=Coalesce(Subquery(unread), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0021_followsuggestion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Take over the auto-created participants table as an explicit model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationMember',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='post.conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'post_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='post.ConversationMember', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_read_state, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0024_post_user_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='followsuggestion',
+            name='marked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
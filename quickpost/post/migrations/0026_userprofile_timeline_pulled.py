@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled_authors(apps, schema_editor):
+    # Accounts already over the fan-out limit have posts nobody was pushed
+    UserProfile = apps.get_model('post', 'UserProfile')
+    limit = getattr(settings, 'TIMELINE_FANOUT_FOLLOWER_LIMIT', 10000)
+    UserProfile.objects.filter(followers_count__gt=limit).update(timeline_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0025_followsuggestion_marked_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='timeline_pulled',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_pulled_authors, migrations.RunPython.noop),
+    ]
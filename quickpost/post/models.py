@@ -1,4 +1,7 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -12,17 +15,57 @@ class Post(models.Model):
     photo = models.ImageField(upload_to='photos/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
-    dislikes = models.ManyToManyField(User, related_name='disliked_posts', blank=True)
+
+    # Denormalized engagement counters, only ever changed with F() expressions
+    # in the same transaction as the row they count (see reconcile_post_counters)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    dislikes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Time-decayed engagement used to order the Top feed. Refreshed whenever
+    # the counters change and re-decayed periodically by the scheduler.
+    rank_score = models.FloatField(default=0, editable=False)
+
+    # Bumped on every change that alters the rendered card (see fragments.py)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    COUNTER_FIELDS = ('likes_count', 'dislikes_count', 'comments_count')
+    DERIVED_FIELDS = COUNTER_FIELDS + ('rank_score', 'version')
 
     class Meta:
         ordering = ['-created_at']  # Default ordering by newest first
+        indexes = [
+            # Backs the keyset pagination of the feed (see feed.paginate)
+            models.Index(fields=['created_at', 'id'], name='post_created_at_id_idx'),
+            models.Index(fields=['rank_score', 'id'], name='post_rank_score_id_idx'),
+            # One range scan per author for the timeline's read-time pull
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_created_id_idx'),
+        ]
 
     def __str__(self):
         # return the username and the content of the post
         # limiting the content to 20 characters for better readability
         return f"{self.user.username} - {self.content[:20]}"
 
+    def save(self, *args, **kwargs):
+        # Never write the counters back from a possibly stale instance,
+        # they are maintained in place by _adjust_counters
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+            super().save(*args, **kwargs)
+            self._bump_version()
+            return
+        if self._state.adding:
+            self.rank_score = self.compute_rank_score()
+        super().save(*args, **kwargs)
+
+    def _bump_version(self):
+        Post.objects.filter(pk=self.pk).update(version=F('version') + 1)
+        self.refresh_from_db(fields=['version'])
+
     def clean(self):
         """Validate post data"""
         if not self.content.strip():
@@ -30,50 +73,124 @@ class Post(models.Model):
         if len(self.content) > 240:
             raise ValidationError('Post content cannot exceed 240 characters.')
 
+    def _adjust_counters(self, **deltas):
+        """Atomically add deltas to the counter columns and refresh them"""
+        updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if updates:
+            updates['version'] = F('version') + 1
+            Post.objects.filter(pk=self.pk).update(**updates)
+            self.refresh_from_db(fields=list(updates))
+            self.rank_score = self.compute_rank_score()
+            Post.objects.filter(pk=self.pk).update(rank_score=self.rank_score)
+
+    @classmethod
+    def _bulk_adjust_counters(cls, deltas):
+        """
+        ``_adjust_counters`` for many posts at once, ``deltas`` mapping post
+        ids to counter deltas: one UPDATE adds them all (and bumps the
+        versions), then one SELECT and one UPDATE refresh the rank scores.
+        """
+        deltas = {pk: post_deltas for pk, post_deltas in deltas.items() if any(post_deltas.values())}
+        if not deltas:
+            return
+        updates = {}
+        for field in cls.COUNTER_FIELDS:
+            whens = [
+                When(pk=pk, then=F(field) + post_deltas[field])
+                for pk, post_deltas in deltas.items() if post_deltas.get(field)
+            ]
+            if whens:
+                updates[field] = Case(*whens, default=F(field), output_field=cls._meta.get_field(field))
+        cls.objects.filter(pk__in=list(deltas)).update(version=F('version') + 1, **updates)
+        cls._refresh_rank_scores(list(deltas))
+
+    @classmethod
+    def _refresh_rank_scores(cls, pks):
+        """Recompute the rank scores of ``pks`` from their counters: one SELECT, one UPDATE"""
+        posts = list(cls.objects.only('id', 'created_at', *cls.COUNTER_FIELDS).filter(pk__in=pks))
+        now = timezone.now()
+        for post in posts:
+            post.rank_score = post.compute_rank_score(now)
+        cls.objects.bulk_update(posts, ['rank_score'])
+
+    def compute_rank_score(self, now=None):
+        """
+        Engagement decayed by age, ``(engagement + 1) / (age_hours + 2) ** gravity``.
+        Posts older than the ranking window score 0 and drop out of the Top feed.
+        """
+        now = now or timezone.now()
+        created_at = self.created_at or now
+        age_hours = max((now - created_at).total_seconds() / 3600, 0)
+        if age_hours > getattr(settings, 'RANK_WINDOW_HOURS', 24):
+            return 0.0
+        engagement = max(self.likes_count + self.comments_count - self.dislikes_count, 0)
+        return (engagement + 1) / (age_hours + 2) ** getattr(settings, 'RANK_GRAVITY', 1.8)
+
     def get_likes_count(self):
         """Get total number of likes"""
-        return self.likes.count()
+        return self.likes_count
 
     def get_dislikes_count(self):
         """Get total number of dislikes"""
-        return self.dislikes.count()
+        return self.dislikes_count
 
     def get_comments_count(self):
         """Get total number of comments"""
-        return self.comments.count()
+        return self.comments_count
 
     def is_liked_by(self, user):
         """Check if user has liked this post"""
-        return self.likes.filter(id=user.id).exists()
+        return self.reactions.filter(user_id=user.id, kind=Reaction.LIKE).exists()
 
     def is_disliked_by(self, user):
         """Check if user has disliked this post"""
-        return self.dislikes.filter(id=user.id).exists()
+        return self.reactions.filter(user_id=user.id, kind=Reaction.DISLIKE).exists()
+
+    def toggle_reaction(self, user, kind):
+        """
+        Toggle a like or dislike for a user, replacing the opposite reaction
+        if there is one. Returns the user's reaction afterwards (or None).
+
+        Each step is a single statement on the (post, user) unique index
+        and the affected row count decides the counter deltas, so the cost
+        doesn't grow with the number of reactions and no lock is needed.
+        """
+        from .reaction_index import invalidate_reaction_index
+
+        counter = Reaction.COUNTER_FIELDS[kind]
+        with transaction.atomic():
+            invalidate_reaction_index(user.id)
+            removed, _ = Reaction.objects.filter(post=self, user=user, kind=kind).delete()
+            if removed:
+                self._adjust_counters(**{counter: -1})
+                return None
+
+            other = Reaction.DISLIKE if kind == Reaction.LIKE else Reaction.LIKE
+            if Reaction.objects.filter(post=self, user=user, kind=other).update(kind=kind):
+                self._adjust_counters(**{counter: 1, Reaction.COUNTER_FIELDS[other]: -1})
+                return kind
+
+            try:
+                with transaction.atomic():
+                    Reaction.objects.create(post=self, user=user, kind=kind)
+            except IntegrityError:
+                # A concurrent request from the same user got there first
+                return kind
+            self._adjust_counters(**{counter: 1})
+            return kind
 
     def toggle_like(self, user):
         """Toggle like status for a user"""
-        if self.is_liked_by(user):
-            self.likes.remove(user)
-            return False
-        else:
-            self.likes.add(user)
-            self.dislikes.remove(user)  # Remove dislike if exists
-            return True
+        return self.toggle_reaction(user, Reaction.LIKE) == Reaction.LIKE
 
     def toggle_dislike(self, user):
         """Toggle dislike status for a user"""
-        if self.is_disliked_by(user):
-            self.dislikes.remove(user)
-            return False
-        else:
-            self.dislikes.add(user)
-            self.likes.remove(user)  # Remove like if exists
-            return True
+        return self.toggle_reaction(user, Reaction.DISLIKE) == Reaction.DISLIKE
 
     @property
     def engagement_score(self):
         """Calculate engagement based on likes, dislikes, and comments"""
-        return self.get_likes_count() + self.get_comments_count() - self.get_dislikes_count()
+        return self.likes_count + self.comments_count - self.dislikes_count
 
     @property
     def time_since_created(self):
@@ -83,7 +200,71 @@ class Post(models.Model):
     @property
     def net_likes(self):
         """Get net likes (likes - dislikes)"""
-        return self.get_likes_count() - self.get_dislikes_count()
+        return self.likes_count - self.dislikes_count
+
+
+class Reaction(models.Model):
+    """A user's like or dislike of a post, at most one per (post, user)"""
+    LIKE = 'like'
+    DISLIKE = 'dislike'
+    KIND_CHOICES = [
+        (LIKE, 'Like'),
+        (DISLIKE, 'Dislike'),
+    ]
+    # Post counter column kept in step with each kind
+    COUNTER_FIELDS = {
+        LIKE: 'likes_count',
+        DISLIKE: 'dislikes_count',
+    }
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reactions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reactions')
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='unique_reaction'),
+        ]
+        indexes = [
+            # "Which of these posts did I react to" lookups for the feed
+            models.Index(fields=['user', 'post'], name='reaction_user_post_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.kind}s post {self.post_id}"
+
+
+class TimelineEntry(models.Model):
+    """A post delivered to a user's home timeline (fan-out on write)"""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Copied from the post so the timeline can be paged and trimmed without a join
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'created_at', 'post'], name='timeline_owner_created_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner.username} <- post {self.post_id}"
+
+
+def encode_path_segment(comment_id):
+    """Fixed-width base-36 id, so that sorting paths as strings is depth-first"""
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    segment = ''
+    while comment_id:
+        comment_id, remainder = divmod(comment_id, 36)
+        segment = digits[remainder] + segment
+    return segment.rjust(Comment.PATH_SEGMENT_LENGTH, '0')
 
 
 class Comment(models.Model):
@@ -93,12 +274,53 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)  # For replies
 
+    # Materialized path: the encoded ids of every ancestor followed by this
+    # comment's own. A thread is a single range scan ordered by path.
+    path = models.CharField(max_length=400, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+
+    PATH_SEGMENT_LENGTH = 8
+    MAX_DEPTH = 400 // PATH_SEGMENT_LENGTH - 1
+
     class Meta:
         ordering = ['created_at']  # Order comments by oldest first
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.content[:20]}"
  
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        # Replies past the deepest level are attached to their parent's parent
+        while self.parent is not None and self.parent.depth >= self.MAX_DEPTH:
+            self.parent = self.parent.parent
+        # Keep Post.comments_count, the path and the parent's reply count
+        # in step with the insert
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            parent_path = self.parent.path if self.parent else ''
+            self.path = parent_path + encode_path_segment(self.pk)
+            self.depth = self.parent.depth + 1 if self.parent else 0
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            if self.parent:
+                Comment.objects.filter(pk=self.parent_id).update(reply_count=F('reply_count') + 1)
+            self.post._adjust_counters(comments_count=1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # Replies are removed by the cascade, count them before they go
+            removed = self.get_thread().count()
+            result = super().delete(*args, **kwargs)
+            if self.parent_id:
+                Comment.objects.filter(pk=self.parent_id).update(reply_count=F('reply_count') - 1)
+            self.post._adjust_counters(comments_count=-removed)
+        return result
+
     def clean(self):
         """Validate comment data"""
         if not self.content.strip():
@@ -116,7 +338,25 @@ class Comment(models.Model):
 
     def get_replies_count(self):
         """Get total number of replies"""
-        return self.get_replies().count()
+        return self.reply_count
+
+    def get_thread(self):
+        """Get this comment and every reply below it, depth-first"""
+        return Comment.thread_of(self.post_id, self.path)
+
+    @staticmethod
+    def thread_of(post_id, path=''):
+        """
+        Get the comments of a post whose path starts with ``path`` (the
+        whole post when empty), depth-first. The prefix match is written as
+        a range so it can use the (post, path) index on every database.
+        """
+        comments = Comment.objects.filter(post_id=post_id)
+        if path:
+            # Smallest string greater than every path starting with ``path``
+            upper = path[:-1] + chr(ord(path[-1]) + 1)
+            comments = comments.filter(path__gte=path, path__lt=upper)
+        return comments.order_by('path')
 
     @property
     def time_since_created(self):
@@ -144,10 +384,30 @@ class UserProfile(models.Model):
         help_text="Users that this user is following"
     )
 
+    # Denormalized follow counters, only ever changed with F() expressions
+    # in the same transaction as the follow row (see reconcile_follow_counts)
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Set once the account has more followers than the timeline fan-out
+    # limit and never cleared: its posts from then on are only pulled at
+    # read time, so it has to stay pulled to keep them in timelines
+    timeline_pulled = models.BooleanField(default=False, editable=False)
+
+    COUNTER_FIELDS = ('followers_count', 'following_count')
+    DERIVED_FIELDS = COUNTER_FIELDS + ('timeline_pulled',)
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
     def save(self, *args, **kwargs):
+        # The post_save signal on User saves whatever profile instance it has
+        # at hand, never write the counters back from it
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
         super().save(*args, **kwargs)
         
         # Resize image if it's too large
@@ -165,35 +425,75 @@ class UserProfile(models.Model):
     @property
     def get_followers_count(self):
         """Get the number of followers"""
-        return self.followers.count()
+        return self.followers_count
 
     @property
     def get_following_count(self):
         """Get the number of users this user is following"""
-        return self.following.count()
+        return self.following_count
 
     def is_following(self, user_profile):
         """Check if this user is following another user"""
+        from .follow_cache import follow_cache, follow_cache_enabled
+
+        if follow_cache_enabled():
+            return follow_cache.is_following(self.id, user_profile.id)
         return self.following.filter(id=user_profile.id).exists()
 
+    def _adjust_follow_counts(self, user_profile, delta):
+        """Atomically move both sides' follow counters and refresh them"""
+        UserProfile.objects.filter(pk=self.pk).update(following_count=F('following_count') + delta)
+        UserProfile.objects.filter(pk=user_profile.pk).update(followers_count=F('followers_count') + delta)
+        self.refresh_from_db(fields=['following_count'])
+        user_profile.refresh_from_db(fields=['followers_count'])
+
     def follow(self, user_profile):
         """Follow another user"""
-        if not self.is_following(user_profile) and self != user_profile:
-            self.following.add(user_profile)
-            return True
-        return False
+        from .follow_cache import invalidate_followees
+        from .suggestions import mark_suggestions_stale
+        from .timeline import backfill_timeline, mark_pulled_author
+
+        if self == user_profile:
+            return False
+        try:
+            with transaction.atomic():
+                # The (from, to) unique constraint settles concurrent follows
+                UserProfile.following.through.objects.create(
+                    from_userprofile=self, to_userprofile=user_profile
+                )
+                self._adjust_follow_counts(user_profile, 1)
+                mark_pulled_author(user_profile)
+                invalidate_followees(self.id)
+                # Touches a row per follower, so it runs after the follow
+                # has committed instead of holding its locks
+                transaction.on_commit(lambda: mark_suggestions_stale(self))
+        except IntegrityError:
+            return False
+        backfill_timeline(self.user_id, user_profile.user_id)
+        return True
 
     def unfollow(self, user_profile):
         """Unfollow another user"""
-        if self.is_following(user_profile):
-            self.following.remove(user_profile)
+        from .follow_cache import invalidate_followees
+        from .suggestions import mark_suggestions_stale
+        from .timeline import remove_author_from_timeline
+
+        with transaction.atomic():
+            removed, _ = UserProfile.following.through.objects.filter(
+                from_userprofile=self, to_userprofile=user_profile
+            ).delete()
+            if removed:
+                self._adjust_follow_counts(user_profile, -1)
+                invalidate_followees(self.id)
+                transaction.on_commit(lambda: mark_suggestions_stale(self))
+        if removed:
+            remove_author_from_timeline(self.user_id, user_profile.user_id)
             return True
         return False
 
     def toggle_follow(self, user_profile):
         """Toggle follow status for another user"""
-        if self.is_following(user_profile):
-            self.unfollow(user_profile)
+        if self.unfollow(user_profile):
             return False  # Now unfollowing
         else:
             self.follow(user_profile)
@@ -216,9 +516,29 @@ def save_user_profile(sender, instance, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
+class FollowSuggestion(models.Model):
+    """Precomputed "who to follow" list of a profile (see suggestions.py)"""
+    profile = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='follow_suggestion')
+    # [[profile_id, mutual_count], ...], best first
+    suggestions = models.JSONField(default=list)
+    computed_at = models.DateTimeField(auto_now=True)
+    # Set when the profile's two-hop neighbourhood changed since computed_at,
+    # and when it last did, so a computation that started earlier leaves it
+    stale = models.BooleanField(default=False)
+    marked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stale'], name='followsuggestion_stale_idx'),
+        ]
+
+    def __str__(self):
+        return f"Suggestions for {self.profile.user.username}"
+
+
 class Conversation(models.Model):
     """Model to represent a conversation between two users"""
-    participants = models.ManyToManyField(User, related_name='conversations')
+    participants = models.ManyToManyField(User, through='ConversationMember', related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -242,7 +562,69 @@ class Conversation(models.Model):
     
     def has_unread_messages(self, user):
         """Check if the conversation has unread messages for the user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).exists()
+        return self.memberships.filter(user=user, unread_count__gt=0).exists()
+
+    def post_message(self, sender, content):
+        """
+        Store a message in one transaction of three statements: the INSERT,
+        one UPDATE of the members (the sender's read cursor moves past their
+        own message, everyone else's unread count goes up) and one UPDATE
+        bumping ``updated_at``. Only ``pk`` is read from ``self``, so a bare
+        ``Conversation(pk=...)`` will do.
+        """
+        with transaction.atomic():
+            message = Message.objects.create(conversation_id=self.pk, sender=sender, content=content)
+            ConversationMember.objects.filter(conversation_id=self.pk).update(
+                last_read_message_id=Case(
+                    When(user_id=sender.id, then=Value(message.id)),
+                    default=F('last_read_message_id'),
+                    output_field=models.PositiveBigIntegerField(),
+                ),
+                unread_count=Case(
+                    When(user_id=sender.id, then=Value(0)),
+                    default=F('unread_count') + 1,
+                ),
+            )
+            Conversation.objects.filter(pk=self.pk).update(updated_at=message.created_at)
+        return message
+
+    def mark_read(self, user, message_id=None):
+        """
+        Move ``user``'s read cursor up to ``message_id`` (the latest message
+        by default) and recompute their unread count, in a single-row
+        UPDATE. The cursor never moves backwards. Returns whether it moved.
+        """
+        messages = Message.objects.filter(conversation=self)
+        if message_id is None:
+            message_id = messages.order_by('-id').values_list('id', flat=True).first()
+            if message_id is None:
+                return False
+        still_unread = (
+            messages.filter(id__gt=message_id).exclude(sender=user)
+            .order_by().values('conversation').annotate(n=Count('*')).values('n')
+        )
+        return bool(self.memberships.filter(user=user, last_read_message_id__lt=message_id).update(
+            last_read_message_id=message_id,
+            unread_count=Coalesce(Subquery(still_unread), 0),
+        ))
+
+
+class ConversationMember(models.Model):
+    """A participant of a conversation and how far they have read it"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    # Highest message id the member has seen, and how many messages from
+    # others came after it, kept up to date by post_message/mark_read
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Originally the auto-created table of Conversation.participants
+        db_table = 'post_conversation_participants'
+        unique_together = [('conversation', 'user')]
+
+    def __str__(self):
+        return f"{self.user.username} in conversation {self.conversation_id}"
 
 
 class Message(models.Model):
@@ -251,10 +633,13 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField(max_length=1000)
     created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Backs the history paging of chat.get_message_page
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_conv_created_idx'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.username}: {self.content[:30]}"
@@ -270,8 +655,4 @@ class Message(models.Model):
     def time_since_created(self):
         """Get time elapsed since message creation"""
         return timezone.now() - self.created_at
-    
-    def mark_as_read(self):
-        """Mark this message as read"""
-        self.is_read = True
-        self.save()
+
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import cache
+
+
+def presence_ttl():
+    """Seconds a chat member stays online without a heartbeat"""
+    return getattr(settings, 'CHAT_PRESENCE_TTL', 45)
+
+
+def presence_heartbeat():
+    """Seconds between the heartbeats a chat client sends"""
+    return presence_ttl() / 3
+
+
+def typing_interval():
+    """
+    Minimum seconds between two typing broadcasts of a socket, and how long
+    a pause has to last before the room hears that typing stopped
+    """
+    return getattr(settings, 'CHAT_TYPING_INTERVAL', 3)
+
+
+def typing_ttl():
+    """Seconds a client shows someone typing without hearing it again"""
+    return typing_interval() * 3
+
+
+def presence_key(conversation_id, user_id):
+    return f'chat_presence:{conversation_id}:{user_id}'
+
+
+async def mark_present(conversation_id, user_id):
+    """
+    Record a heartbeat of ``user_id`` in the conversation. True when they
+    were not online yet, i.e. when the room needs to hear about it.
+    """
+    key = presence_key(conversation_id, user_id)
+    if await cache.atouch(key, presence_ttl()):
+        return False
+    return await cache.aadd(key, True, presence_ttl())
+
+
+async def mark_absent(conversation_id, user_id):
+    await cache.adelete(presence_key(conversation_id, user_id))
+
+
+async def online_user_ids(conversation_id, user_ids):
+    """The members of ``user_ids`` with a live heartbeat, in one cache fetch"""
+    keys = {presence_key(conversation_id, user_id): user_id for user_id in user_ids}
+    found = await cache.aget_many(list(keys))
+    return sorted(keys[key] for key in found)
+
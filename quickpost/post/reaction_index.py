@@ -0,0 +1,104 @@
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Reaction
+
+
+def reaction_index_timeout():
+    """Seconds a user's reaction index stays cached"""
+    return getattr(settings, 'REACTION_INDEX_TIMEOUT', 3600)
+
+
+def reaction_index_key(user_id):
+    return f'reaction_index:{user_id}'
+
+
+def reaction_version_key(user_id):
+    return f'reaction_version:{user_id}'
+
+
+class ReactionIndex:
+    """
+    Sorted arrays of the post IDs a user liked and disliked.
+
+    Eight bytes per reaction, answered with a binary search per post, so a
+    page of cards is resolved in memory from a single cache fetch.
+    """
+
+    def __init__(self, liked, disliked):
+        self.liked = liked
+        self.disliked = disliked
+
+    @classmethod
+    def build(cls, user_id):
+        """Read every reaction of ``user_id`` along the (user, post) index"""
+        liked, disliked = array('q'), array('q')
+        rows = Reaction.objects.filter(user_id=user_id).order_by('post_id').values_list('post_id', 'kind')
+        for post_id, kind in rows.iterator(chunk_size=2000):
+            (liked if kind == Reaction.LIKE else disliked).append(post_id)
+        return cls(liked, disliked)
+
+    @staticmethod
+    def _contains(ids, post_id):
+        i = bisect_left(ids, post_id)
+        return i < len(ids) and ids[i] == post_id
+
+    def kinds_of(self, post_ids):
+        """``{post_id: kind}`` for the posts in ``post_ids`` the user reacted to"""
+        kinds = {}
+        for post_id in post_ids:
+            if self._contains(self.liked, post_id):
+                kinds[post_id] = Reaction.LIKE
+            elif self._contains(self.disliked, post_id):
+                kinds[post_id] = Reaction.DISLIKE
+        return kinds
+
+    def __getstate__(self):
+        return self.liked.tobytes(), self.disliked.tobytes()
+
+    def __setstate__(self, state):
+        self.liked, self.disliked = array('q'), array('q')
+        self.liked.frombytes(state[0])
+        self.disliked.frombytes(state[1])
+
+
+def get_reaction_index(user_id):
+    """
+    The cached reaction index of ``user_id``, built on a miss.
+
+    The index is stored with the version of the user's reactions it was
+    built at and only used while that version is current, so an index a
+    concurrent request built from rows read before a toggle committed is
+    never served after it. Version and index come in one cache fetch.
+    """
+    key, version_key = reaction_index_key(user_id), reaction_version_key(user_id)
+    found = cache.get_many([key, version_key])
+    version = found.get(version_key)
+    if version is None:
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    entry = found.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    index = ReactionIndex.build(user_id)
+    cache.set(key, (version, index), reaction_index_timeout())
+    return index
+
+
+def invalidate_reaction_index(*user_ids):
+    """
+    Give ``user_ids`` a new reaction version, which retires their cached
+    indexes. Done again once the surrounding transaction commits, in case a
+    concurrent request rebuilt them from the old rows in between.
+    """
+    def bump():
+        version = time.time_ns()
+        cache.set_many({reaction_version_key(user_id): version for user_id in user_ids}, None)
+
+    bump()
+    transaction.on_commit(bump)
@@ -0,0 +1,328 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Post, Reaction
+from .reaction_index import invalidate_reaction_index
+
+logger = logging.getLogger(__name__)
+
+# Seconds a reaction buffer lock outlives a holder that died
+BUFFER_LOCK_TIMEOUT = 30
+
+
+def apply_reaction_states(states):
+    """
+    Bring reactions to the given final states in one transaction.
+
+    ``states`` maps ``(post_id, user_id)`` to ``'like'``, ``'dislike'`` or
+    None. Current rows are read in bulk, only the differences are written,
+    and the counters of all touched posts move in one F() update. Applying the
+    same states twice is a no-op, which is what makes retrying a flush safe.
+    Returns ``{post_id: (likes_count, dislikes_count)}`` for touched posts.
+    """
+    if not states:
+        return {}
+    post_ids = {post_id for post_id, _ in states}
+    user_ids = {user_id for _, user_id in states}
+
+    with transaction.atomic(savepoint=False):
+        invalidate_reaction_index(*user_ids)
+        current = {
+            (reaction.post_id, reaction.user_id): reaction
+            for reaction in Reaction.objects.filter(post_id__in=post_ids, user_id__in=user_ids)
+            if (reaction.post_id, reaction.user_id) in states
+        }
+
+        to_delete, to_update, to_create = [], defaultdict(list), []
+        deltas = defaultdict(lambda: defaultdict(int))
+        for (post_id, user_id), kind in states.items():
+            existing = current.get((post_id, user_id))
+            old_kind = existing.kind if existing else None
+            if old_kind == kind:
+                continue
+            if old_kind:
+                deltas[post_id][Reaction.COUNTER_FIELDS[old_kind]] -= 1
+            if kind:
+                deltas[post_id][Reaction.COUNTER_FIELDS[kind]] += 1
+
+            if kind is None:
+                to_delete.append(existing.id)
+            elif existing:
+                to_update[kind].append(existing.id)
+            else:
+                to_create.append(Reaction(post_id=post_id, user_id=user_id, kind=kind))
+
+        if to_delete:
+            Reaction.objects.filter(id__in=to_delete).delete()
+        for kind, ids in to_update.items():
+            Reaction.objects.filter(id__in=ids).update(kind=kind)
+        Reaction.objects.bulk_create(to_create)
+
+        Post._bulk_adjust_counters(deltas)
+
+    return {
+        post_id: (post.likes_count, post.dislikes_count)
+        for post_id, post in Post.objects.filter(id__in=post_ids)
+        .only('id', 'likes_count', 'dislikes_count').in_bulk().items()
+    }
+
+
+@contextmanager
+def _cache_lock(key):
+    """Mutex shared by every process using the cache (SET NX on Redis)"""
+    while not cache.add(key, True, BUFFER_LOCK_TIMEOUT):
+        time.sleep(0.001)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+class ReactionBuffer:
+    """
+    Write-behind buffer for reaction toggles, shared by every worker through
+    the cache.
+
+    A toggle is resolved against the buffered state (or the database when
+    the pair isn't buffered), recorded as the resulting state and answered
+    straight away with an optimistic count. The buffered toggles of a user
+    are one cache entry mapping post ID to ``(state in the database,
+    buffered state)``, read and rewritten under a per-user cache lock, so
+    toggles of one user landing on different workers resolve against each
+    other. Counter changes not yet in the database are one cache counter
+    per post and field, moved with atomic increments.
+
+    A background thread in every process flushes the buffer every
+    REACTION_BUFFER_FLUSH_INTERVAL seconds through apply_reaction_states,
+    one worker at a time, so a burst on a viral post becomes one write
+    transaction per interval instead of one per request. Entries are only
+    dropped once their write committed and states are idempotent, so a
+    worker dying mid-flush leaves its batch to the next flush.
+    """
+
+    def __init__(self, flush_interval=1.0, prefix='reaction_buffer'):
+        self._flush_interval = flush_interval
+        self._prefix = prefix
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _key(self, *parts):
+        return ':'.join(str(part) for part in (self._prefix, *parts))
+
+    def _delta_key(self, post_id, field):
+        return self._key('delta', post_id, field)
+
+    def _add_deltas(self, deltas):
+        for (post_id, field), change in deltas.items():
+            if change:
+                key = self._delta_key(post_id, field)
+                cache.add(key, 0, None)
+                cache.incr(key, change)
+
+    def _set_pending(self, user_id, pending):
+        """Store a user's buffered toggles and keep the dirty set in step. Needs the user's lock"""
+        if pending:
+            cache.set(self._key('user', user_id), pending, None)
+        else:
+            cache.delete(self._key('user', user_id))
+        dirty = self._key('dirty')
+        if (user_id in cache.get(dirty, set())) != bool(pending):
+            with _cache_lock(self._key('lock', 'dirty')):
+                user_ids = cache.get(dirty, set())
+                if pending:
+                    user_ids.add(user_id)
+                else:
+                    user_ids.discard(user_id)
+                cache.set(dirty, user_ids, None)
+
+    def toggle(self, post, user, kind):
+        """Toggle a reaction. Returns the resulting kind (or None)"""
+        return self.toggle_many(user.id, [(post.id, kind)])[0]
+
+    def toggle_many(self, user_id, toggles):
+        """
+        Apply ``(post_id, kind)`` toggles of one user in order. Returns the
+        resulting kind of each toggle.
+        """
+        with _cache_lock(self._key('lock', user_id)):
+            pending = cache.get(self._key('user', user_id), {})
+            # A pair leaves the buffer only after its state is in the
+            # database, and only under this lock, so unbuffered pairs can be
+            # read from there
+            unbuffered = {post_id for post_id, _ in toggles} - pending.keys()
+            stored = dict(
+                Reaction.objects.filter(user_id=user_id, post_id__in=unbuffered)
+                .values_list('post_id', 'kind')
+            ) if unbuffered else {}
+
+            results, deltas = [], defaultdict(int)
+            for post_id, kind in toggles:
+                base, current = pending.get(post_id, (stored.get(post_id),) * 2)
+                new_kind = None if current == kind else kind
+                pending[post_id] = (base, new_kind)
+                if current:
+                    deltas[post_id, Reaction.COUNTER_FIELDS[current]] -= 1
+                if new_kind:
+                    deltas[post_id, Reaction.COUNTER_FIELDS[new_kind]] += 1
+                results.append(new_kind)
+            self._set_pending(user_id, pending)
+            self._add_deltas(deltas)
+        return results
+
+    def optimistic_counts(self, post):
+        """Stored counters of ``post`` plus the buffered changes"""
+        fields = ('likes_count', 'dislikes_count')
+        deltas = cache.get_many([self._delta_key(post.id, field) for field in fields])
+        return tuple(
+            getattr(post, field) + deltas.get(self._delta_key(post.id, field), 0)
+            for field in fields
+        )
+
+    def buffered_kinds(self, user_id, post_ids):
+        """``{post_id: kind}`` of the buffered reactions of ``user_id``"""
+        pending = cache.get(self._key('user', user_id), {})
+        return {post_id: pending[post_id][1] for post_id in post_ids if post_id in pending}
+
+    def flush(self):
+        """
+        Write the buffered states to the database. Returns how many, 0 as
+        well when another worker is flushing.
+        """
+        flush_lock = self._key('lock', 'flush')
+        if not cache.add(flush_lock, True, BUFFER_LOCK_TIMEOUT):
+            return 0
+        try:
+            user_ids = cache.get(self._key('dirty'), set())
+            batch = {
+                user_id: cache.get(self._key('user', user_id), {}) for user_id in user_ids
+            }
+            states = {
+                (post_id, user_id): kind
+                for user_id, pending in batch.items()
+                for post_id, (_, kind) in pending.items()
+            }
+            if not states:
+                return 0
+
+            apply_reaction_states(states)
+
+            for user_id, written in batch.items():
+                with _cache_lock(self._key('lock', user_id)):
+                    pending = cache.get(self._key('user', user_id), {})
+                    deltas = defaultdict(int)
+                    for post_id, (base, kind) in written.items():
+                        if post_id not in pending or pending[post_id][0] != base:
+                            # Settled by a flush that outlived its lock
+                            continue
+                        if base:
+                            deltas[post_id, Reaction.COUNTER_FIELDS[base]] += 1
+                        if kind:
+                            deltas[post_id, Reaction.COUNTER_FIELDS[kind]] -= 1
+                        # The database now holds ``kind``, toggles since stay buffered
+                        current = pending[post_id][1]
+                        if current == kind:
+                            del pending[post_id]
+                        else:
+                            pending[post_id] = (kind, current)
+                    self._set_pending(user_id, pending)
+                    self._add_deltas(deltas)
+            return len(states)
+        finally:
+            cache.delete(flush_lock)
+
+    def start(self):
+        """Start the background flush thread"""
+        self._thread = threading.Thread(target=self._run, name='reaction-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write out what is left"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self._flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing reaction buffer: {e}")
+
+
+def reaction_batch_max_size():
+    """Largest number of operations accepted by one batch request"""
+    return getattr(settings, 'REACTION_BATCH_MAX_SIZE', 100)
+
+
+def apply_reaction_batch(user, operations):
+    """
+    Apply a list of ``(post_id, kind)`` toggles for ``user``.
+
+    Current reactions are read once for all posts and the toggles are
+    folded in memory in order, so toggling the same post twice in a batch
+    behaves as it would one request at a time. The final states are then
+    written in the transaction they were read in (or handed to the
+    write-behind buffer).
+    Returns the resulting kind of each operation, ``False`` for unknown
+    posts, and ``{post_id: (likes_count, dislikes_count)}``.
+    """
+    post_ids = {post_id for post_id, _ in operations}
+    buffer = get_reaction_buffer()
+    if buffer is not None:
+        posts = Post.objects.only('id', 'likes_count', 'dislikes_count').in_bulk(post_ids)
+        toggles = [(post_id, kind) for post_id, kind in operations if post_id in posts]
+        kinds = iter(buffer.toggle_many(user.id, toggles))
+        counts = {post_id: buffer.optimistic_counts(post) for post_id, post in posts.items()}
+    else:
+        with transaction.atomic():
+            # Lock the posts before reading the user's reactions, so two
+            # batches of the same user toggle them one after the other
+            posts = Post.objects.select_for_update().only('id', 'likes_count', 'dislikes_count') \
+                .in_bulk(post_ids)
+            state = dict(
+                Reaction.objects.filter(user_id=user.id, post_id__in=list(posts))
+                .values_list('post_id', 'kind')
+            )
+            kinds = []
+            for post_id, kind in operations:
+                if post_id in posts:
+                    state[post_id] = None if state.get(post_id) == kind else kind
+                    kinds.append(state[post_id])
+            kinds = iter(kinds)
+            counts = {post_id: (post.likes_count, post.dislikes_count) for post_id, post in posts.items()}
+            counts.update(apply_reaction_states(
+                {(post_id, user.id): kind for post_id, kind in state.items()}
+            ))
+
+    results = [next(kinds) if post_id in posts else False for post_id, _ in operations]
+    return results, counts
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_reaction_buffer():
+    """The process-wide reaction buffer, or None when write-behind is off"""
+    global _buffer
+
+    if not getattr(settings, 'REACTION_WRITE_BEHIND', False):
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ReactionBuffer(
+                    flush_interval=getattr(settings, 'REACTION_BUFFER_FLUSH_INTERVAL', 1.0),
+                )
+                _buffer.start()
+                atexit.register(_buffer.stop)
+    return _buffer
@@ -19,6 +19,36 @@ def refresh_quote_job():
         logger.error(f"Error refreshing quote: {e}")
         print(f"[APScheduler] Error refreshing quote: {e}")
 
+def redecay_rank_scores_job():
+    """Job to re-apply time decay to the Top feed scores"""
+    try:
+        from .feed import redecay_rank_scores
+
+        updated = redecay_rank_scores()
+        logger.info(f"Re-decayed rank scores of {updated} posts")
+    except Exception as e:
+        logger.error(f"Error re-decaying rank scores: {e}")
+
+def trim_timelines_job():
+    """Job to cap the size of every home timeline"""
+    try:
+        from .timeline import trim_timelines
+
+        trimmed = trim_timelines()
+        logger.info(f"Trimmed {trimmed} timeline entries")
+    except Exception as e:
+        logger.error(f"Error trimming timelines: {e}")
+
+def compute_follow_suggestions_job():
+    """Job to recompute follow suggestions whose neighbourhood changed"""
+    try:
+        from .suggestions import compute_suggestions
+
+        computed = compute_suggestions()
+        logger.info(f"Recomputed follow suggestions of {computed} profiles")
+    except Exception as e:
+        logger.error(f"Error computing follow suggestions: {e}")
+
 # Global scheduler instance
 scheduler = None
 
@@ -42,6 +72,36 @@ def start_scheduler():
         max_instances=1
     )
     
+    scheduler.add_job(
+        redecay_rank_scores_job,
+        'interval',
+        minutes=15,
+        id='redecay_rank_scores',
+        name='Re-decay Top Feed Scores',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    scheduler.add_job(
+        trim_timelines_job,
+        'interval',
+        hours=1,
+        id='trim_timelines',
+        name='Trim Home Timelines',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    scheduler.add_job(
+        compute_follow_suggestions_job,
+        'interval',
+        hours=1,
+        id='compute_follow_suggestions',
+        name='Recompute Follow Suggestions',
+        replace_existing=True,
+        max_instances=1
+    )
+
     # Run the job immediately on startup to ensure we have a quote
     scheduler.add_job(
         refresh_quote_job,
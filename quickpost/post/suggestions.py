@@ -0,0 +1,176 @@
+import logging
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import FollowSuggestion, UserProfile
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - the pure Python path is used instead
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def suggestions_top_k():
+    """Number of suggestions kept per profile"""
+    return getattr(settings, 'FOLLOW_SUGGESTIONS_TOP_K', 10)
+
+
+class FollowGraph:
+    """
+    The whole follow graph in compressed sparse row form.
+
+    Profiles are renumbered densely; ``indices[indptr[i]:indptr[i + 1]]``
+    are the (sorted) dense numbers of the profiles profile ``i`` follows.
+    Two flat integer arrays, so even a large graph costs a few bytes per
+    edge instead of a Python object per follow.
+    """
+
+    def __init__(self, profile_ids, indptr, indices):
+        self.profile_ids = profile_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.position = {profile_id: i for i, profile_id in enumerate(profile_ids)}
+
+    @classmethod
+    def load(cls):
+        """
+        Read the follow table once, ordered to fill the arrays in a single
+        pass. Follows of profiles created after the profiles were read are
+        left out; they are marked stale and picked up by the next run.
+        """
+        profile_ids = array('q', UserProfile.objects.order_by('id').values_list('id', flat=True))
+        position = {profile_id: i for i, profile_id in enumerate(profile_ids)}
+        indptr = array('q', [0] * (len(profile_ids) + 1))
+        indices = array('q')
+        follows = UserProfile.following.through.objects.order_by(
+            'from_userprofile_id', 'to_userprofile_id'
+        ).values_list('from_userprofile_id', 'to_userprofile_id')
+        for follower, followee in follows.iterator(chunk_size=10000):
+            if follower not in position or followee not in position:
+                continue
+            indptr[position[follower] + 1] += 1
+            indices.append(position[followee])
+        for i in range(len(profile_ids)):
+            indptr[i + 1] += indptr[i]
+
+        if np is not None:
+            return cls(profile_ids, np.frombuffer(indptr, dtype=np.int64),
+                       np.frombuffer(indices, dtype=np.int64))
+        return cls(profile_ids, indptr, indices)
+
+    def following(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def suggest(self, profile_id, k):
+        """
+        Top ``k`` ``[profile_id, mutual_count]`` pairs for ``profile_id``:
+        the profiles followed by the most of its followees, which it doesn't
+        follow yet. Ties go to the older account.
+        """
+        i = self.position.get(profile_id)
+        if i is None:
+            return []
+        followees = self.following(i)
+        if not len(followees):
+            return []
+
+        if np is not None:
+            candidates = np.concatenate([self.following(f) for f in followees])
+            candidates, counts = np.unique(candidates, return_counts=True)
+            keep = ~np.isin(candidates, followees) & (candidates != i)
+            candidates, counts = candidates[keep], counts[keep]
+            # Highest count first, lowest dense number (oldest profile) on ties
+            best = np.lexsort((candidates, -counts))[:k]
+            ranked = zip(candidates[best].tolist(), counts[best].tolist())
+        else:
+            counts = Counter()
+            for f in followees:
+                counts.update(self.following(f))
+            followed = set(followees)
+            followed.add(i)
+            ranked = sorted(
+                ((c, n) for c, n in counts.items() if c not in followed),
+                key=lambda item: (-item[1], item[0]),
+            )[:k]
+        return [[self.profile_ids[c], n] for c, n in ranked]
+
+
+def compute_suggestions(profile_ids=None, graph=None, batch_size=1000):
+    """
+    Recompute and store the suggestions of ``profile_ids`` (all profiles
+    with stale or missing suggestions when None). Returns how many.
+    """
+    # Marks set from here on describe changes the graph may not include
+    started = timezone.now()
+    if profile_ids is None:
+        profile_ids = list(
+            UserProfile.objects.exclude(follow_suggestion__stale=False).values_list('id', flat=True)
+        )
+    if not profile_ids:
+        return 0
+    graph = graph or FollowGraph.load()
+    k = suggestions_top_k()
+
+    for start in range(0, len(profile_ids), batch_size):
+        batch = profile_ids[start:start + batch_size]
+        rows = [
+            FollowSuggestion(profile_id=profile_id, suggestions=graph.suggest(profile_id, k))
+            for profile_id in batch
+        ]
+        with transaction.atomic():
+            FollowSuggestion.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['profile'],
+                update_fields=['suggestions', 'computed_at'],
+            )
+            FollowSuggestion.objects.filter(profile_id__in=batch, stale=True).filter(
+                Q(marked_at__lt=started) | Q(marked_at__isnull=True)
+            ).update(stale=False)
+    logger.info(f"Computed follow suggestions for {len(profile_ids)} profiles")
+    return len(profile_ids)
+
+
+def mark_suggestions_stale(profile):
+    """
+    Flag the profiles whose friends-of-friends changed because ``profile``
+    followed or unfollowed someone: itself and its followers. Called once
+    the follow has committed (see UserProfile.follow).
+    """
+    followers = UserProfile.following.through.objects.filter(
+        to_userprofile=profile
+    ).values('from_userprofile_id')
+    # Already stale rows get the new time too, in case a computation that
+    # started before this change is about to clear them
+    FollowSuggestion.objects.filter(
+        Q(profile=profile) | Q(profile_id__in=followers)
+    ).update(stale=True, marked_at=timezone.now())
+
+
+def get_suggestions(profile):
+    """
+    Suggested profiles for ``profile`` from the stored list, with their
+    mutual-follow counts, skipping anyone followed since it was computed.
+    """
+    stored = FollowSuggestion.objects.filter(profile=profile).values_list('suggestions', flat=True).first()
+    if not stored:
+        return []
+    mutual = dict(stored)
+    followed = set(
+        UserProfile.following.through.objects.filter(
+            from_userprofile=profile, to_userprofile_id__in=list(mutual)
+        ).values_list('to_userprofile_id', flat=True)
+    )
+    profiles = UserProfile.objects.select_related('user').in_bulk(
+        [profile_id for profile_id in mutual if profile_id not in followed]
+    )
+    return [
+        (profiles[profile_id], count)
+        for profile_id, count in stored
+        if profile_id in profiles
+    ]
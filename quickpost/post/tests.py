@@ -1,3 +1,1021 @@
-from django.test import TestCase
+import json
+import random
+from datetime import timedelta
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from .chat import get_message_page
+from .chat_writer import write_message_batch
+from .consumers import ChatConsumer
+from .feed import InvalidCursor, encode_cursor, get_top_page, redecay_rank_scores
+from .follow_cache import FollowCache, follow_cache
+from .models import (
+    Post, Comment, Conversation, ConversationMember, FollowSuggestion, Message, Reaction,
+    TimelineEntry, UserProfile,
+)
+from .reaction_index import get_reaction_index, reaction_index_key, reaction_version_key
+from .reactions import ReactionBuffer
+from .suggestions import FollowGraph, compute_suggestions, get_suggestions
+from .timeline import fan_out_post, get_timeline_page
 
 # Create your tests here.
+
+
+class FeedQueryCountTests(TestCase):
+    """The feed must render in a fixed number of queries"""
+
+    def setUp(self):
+        cache.clear()
+        # Keep the quote lookup away from the Gemini API
+        cache.set('daily_quote', 'Test quote - Tester', None)
+        self.viewer = User.objects.create_user('viewer', password='secret')
+        self.authors = [User.objects.create_user(f'author{i}') for i in range(3)]
+        self.client.force_login(self.viewer)
+
+    def create_posts(self, count):
+        for i in range(count):
+            author = self.authors[i % len(self.authors)]
+            post = Post.objects.create(user=author, content=f'Post {i}')
+            for commenter in self.authors:
+                Comment.objects.create(post=post, user=commenter, content='Nice')
+            if i % 2:
+                post.toggle_like(self.viewer)
+            else:
+                post.toggle_dislike(self.authors[0])
+
+    def assert_feed_queries(self, page_size, queries=6):
+        # session, user, page, viewer reaction index, comments of uncached
+        # cards, viewer profile
+        with override_settings(FEED_PAGE_SIZE=page_size), self.assertNumQueries(queries):
+            response = self.client.get(reverse('post_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']), page_size)
+        return response
+
+    def test_small_page(self):
+        self.create_posts(10)
+        self.assert_feed_queries(5)
+
+    def test_large_page(self):
+        self.create_posts(30)
+        response = self.assert_feed_queries(25)
+        liked = [post.viewer_liked for post in response.context['posts']]
+        self.assertEqual(liked.count(True), sum(p.likes_count for p in response.context['posts']))
+
+    def test_warm_cache_skips_comments(self):
+        self.create_posts(10)
+        self.assert_feed_queries(5)
+        self.assert_feed_queries(5, queries=4)
+
+
+class PostCardCacheTests(TestCase):
+    """Cached post cards must follow edits and stay viewer specific"""
+
+    def setUp(self):
+        cache.clear()
+        cache.set('daily_quote', 'Test quote - Tester', None)
+        self.author = User.objects.create_user('author', password='secret')
+        self.reader = User.objects.create_user('reader', password='secret')
+        self.post = Post.objects.create(user=self.author, content='Original')
+
+    def get_feed(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('post_list')).content.decode()
+
+    def test_edit_and_reaction_invalidate_card(self):
+        self.assertIn('Original', self.get_feed(self.reader))
+        self.post.content = 'Edited'
+        self.post.save()
+        self.assertIn('Edited', self.get_feed(self.reader))
+
+        self.post.toggle_like(self.reader)
+        html = self.get_feed(self.reader)
+        self.assertIn('like-btn liked', html)
+        self.assertIn('<span class="count">1</span>', html)
+
+    def test_viewer_specific_parts(self):
+        self.get_feed(self.reader)
+        self.assertNotIn(reverse('edit_post', args=[self.post.id]), self.get_feed(self.reader))
+        self.assertIn(reverse('edit_post', args=[self.post.id]), self.get_feed(self.author))
+        self.assertNotIn('<!--slot:', self.get_feed(self.author))
+
+
+class TopFeedTests(TestCase):
+    """Top feed ranking, re-decay and paging through a moving ranking"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(f'fan{i}') for i in range(15)]
+        author = self.users[0]
+        # Post i has 5 - i likes, so the ranking is the creation order
+        self.posts = [Post.objects.create(user=author, content=f'Post {i}') for i in range(6)]
+        for i, post in enumerate(self.posts):
+            for user in self.users[:5 - i]:
+                post.toggle_reaction(user, Reaction.LIKE)
+        self.expected = [post.id for post in self.posts]
+
+    def read(self, page_size, cursor=None):
+        posts, cursor = get_top_page(cursor=cursor, page_size=page_size)
+        return [post.id for post in posts], cursor
+
+    def test_ranking_and_redecay(self):
+        old = Post.objects.create(user=self.users[0], content='Old')
+        Post.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=2))
+        # Still ranked on the score it got when it was written
+        self.assertIn(old.id, self.read(10)[0])
+
+        self.assertEqual(redecay_rank_scores(), len(self.posts) + 1)
+        old.refresh_from_db()
+        self.assertEqual(old.rank_score, 0)
+        self.assertEqual(self.read(10), (self.expected, None))
+
+    def test_pages_keep_their_order_while_scores_move(self):
+        first, cursor = self.read(2)
+        self.assertEqual(first, self.expected[:2])
+        # The last post overtakes everything and scores decay in between
+        for user in self.users[5:]:
+            self.posts[-1].toggle_reaction(user, Reaction.LIKE)
+        redecay_rank_scores()
+
+        second, cursor = self.read(2, cursor)
+        third, cursor = self.read(2, cursor)
+        self.assertEqual(first + second + third, self.expected)
+        self.assertIsNone(cursor)
+        # A new session sees the new ranking
+        self.assertEqual(self.read(2)[0][0], self.posts[-1].id)
+
+    def test_expired_snapshot(self):
+        _, cursor = self.read(2)
+        cache.clear()
+        with self.assertRaises(InvalidCursor):
+            self.read(2, cursor)
+
+
+class InboxQueryCountTests(TestCase):
+    """The inbox must render in a fixed number of queries"""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer', password='secret')
+        self.client.force_login(self.viewer)
+
+    def create_conversations(self, count, start=0):
+        for i in range(start, start + count):
+            other = User.objects.create_user(f'friend{i}')
+            conversation = Conversation.objects.create()
+            conversation.participants.add(self.viewer, other)
+            conversation.post_message(self.viewer, 'Hi')
+            conversation.post_message(other, f'Reply {i}')
+
+    def get_inbox(self):
+        # session, user, conversations, participants with profiles
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('conversations_list'))
+        self.assertEqual(response.status_code, 200)
+        return response.context['conversations']
+
+    def test_query_count_is_constant(self):
+        self.create_conversations(3)
+        self.get_inbox()
+        self.create_conversations(12, start=3)
+        self.assertEqual(len(self.get_inbox()), 15)
+
+    def test_last_message_and_unread_state(self):
+        self.create_conversations(2)
+        first, second = self.get_inbox()
+        self.assertEqual(first['last_message'].content, 'Reply 1')
+        self.assertEqual(first['other_participant'].username, 'friend1')
+        self.assertTrue(first['has_unread'])
+        self.assertEqual(first['unread_count'], 1)
+
+
+class TimelineTests(TestCase):
+    """Home timelines built by fan-out on write and pulled at read time"""
+
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.minutes = 0
+
+    def publish(self, author):
+        # Each post is a minute newer than the last so the expected order is unambiguous
+        self.minutes += 1
+        post = Post.objects.create(user=author, content=f'Post by {author.username}')
+        post.created_at = timezone.now() - timedelta(days=1) + timedelta(minutes=self.minutes)
+        post.save(update_fields=['created_at'])
+        fan_out_post(post)
+        return post
+
+    def timeline(self, viewer=None, page_size=20):
+        ids, cursor = [], None
+        while True:
+            posts, cursor = get_timeline_page(viewer or self.reader, cursor, page_size)
+            ids.extend(post.id for post in posts)
+            if cursor is None:
+                return ids
+
+    def test_fan_out_newest_first(self):
+        self.reader.profile.follow(self.alice.profile)
+        self.reader.profile.follow(self.bob.profile)
+        posts = [self.publish(self.alice), self.publish(self.bob), self.publish(self.alice)]
+
+        expected = [post.id for post in reversed(posts)]
+        self.assertEqual(self.timeline(), expected)
+        self.assertEqual(self.timeline(page_size=2), expected)
+        self.assertEqual(self.timeline(self.alice), [posts[2].id, posts[0].id])
+        self.assertEqual(self.timeline(User.objects.create_user('stranger')), [])
+
+    @override_settings(TIMELINE_BACKFILL_SIZE=2)
+    def test_follow_backfills_and_unfollow_purges(self):
+        older, newer, newest = [self.publish(self.alice) for _ in range(3)]
+        self.reader.profile.follow(self.bob.profile)
+        bobs = self.publish(self.bob)
+
+        self.reader.profile.follow(self.alice.profile)
+        self.assertEqual(self.timeline(), [bobs.id, newest.id, newer.id])
+
+        self.reader.profile.unfollow(self.alice.profile)
+        self.assertEqual(self.timeline(), [bobs.id])
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.reader, author=self.alice).exists())
+
+    @override_settings(TIMELINE_FANOUT_FOLLOWER_LIMIT=1)
+    def test_hybrid_merges_pulled_authors(self):
+        self.reader.profile.follow(self.alice.profile)
+        self.reader.profile.follow(self.bob.profile)
+        # Pushed while alice is under the limit, pulled once she crosses it
+        pushed = self.publish(self.alice)
+        User.objects.create_user('fan').profile.follow(self.alice.profile)
+        posts = [pushed, self.publish(self.bob), self.publish(self.alice),
+                 self.publish(self.bob), self.publish(self.alice)]
+
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader, author=self.alice).count(), 1)
+        expected = [post.id for post in reversed(posts)]
+        self.assertEqual(self.timeline(), expected)
+        self.assertEqual(self.timeline(page_size=2), expected)
+
+    @override_settings(TIMELINE_FANOUT_FOLLOWER_LIMIT=1)
+    def test_pulled_author_stays_pulled(self):
+        self.reader.profile.follow(self.alice.profile)
+        fan = User.objects.create_user('fan')
+        fan.profile.follow(self.alice.profile)
+        while_pulled = self.publish(self.alice)
+
+        # Back under the limit, the posts that were never pushed must stay
+        fan.profile.unfollow(self.alice.profile)
+        self.alice.profile.refresh_from_db()
+        self.assertTrue(self.alice.profile.timeline_pulled)
+        after = self.publish(self.alice)
+        self.assertEqual(self.timeline(), [after.id, while_pulled.id])
+
+
+@override_settings(FOLLOW_LIST_PAGE_SIZE=10)
+class FollowListQueryCountTests(TestCase):
+    """Follower and following lists render in a fixed number of queries"""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer', password='secret')
+        self.target = User.objects.create_user('target')
+        self.others = [User.objects.create_user(f'follower{i}') for i in range(25)]
+        for i, other in enumerate(self.others):
+            other.profile.follow(self.target.profile)
+            self.target.profile.follow(other.profile)
+            for n in range(i % 3):
+                Post.objects.create(user=other, content=f'Post {n}')
+            if i % 2:
+                self.viewer.profile.follow(other.profile)
+        self.client.force_login(self.viewer)
+
+    def read_pages(self, name, context_name):
+        # session, user, listed user, their profile, page of follows with
+        # post counts, viewer profile, viewer's follow status, listed user's
+        # profile in the header
+        seen, cursor = [], None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            with self.assertNumQueries(8):
+                response = self.client.get(reverse(name, args=[self.target.username]), params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(response.context[context_name])
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                return seen
+
+    def assert_rows(self, rows):
+        self.assertEqual(len(rows), len(self.others))
+        for row in rows:
+            index = self.others.index(row['profile'].user)
+            self.assertEqual(row['profile'].posts_count, index % 3)
+            self.assertEqual(row['is_following'], bool(index % 2))
+
+    def test_followers(self):
+        self.assert_rows(self.read_pages('followers_list', 'followers'))
+
+    def test_following(self):
+        self.assert_rows(self.read_pages('following_list', 'following'))
+
+
+class FollowCacheTests(TestCase):
+    """Process-local followee lists, their LRU and their invalidation"""
+
+    def setUp(self):
+        cache.clear()
+        follow_cache.clear()
+        self.profiles = [User.objects.create_user(f'member{i}').profile for i in range(4)]
+
+    def test_lru(self):
+        # Another process's cache: the follows below only bump the shared versions
+        local = FollowCache(max_users=2, recheck_interval=60)
+        first, second, third, fourth = self.profiles
+        first.follow(fourth)
+        with self.assertNumQueries(1):
+            self.assertTrue(local.is_following(first.id, fourth.id))
+        with self.assertNumQueries(0):
+            self.assertFalse(local.is_following(first.id, second.id))
+        local.followee_ids(second.id)
+        local.followee_ids(third.id)
+        self.assertEqual(sorted(local.stats()['per_user']), [second.id, third.id])
+        with self.assertNumQueries(1):
+            local.followee_ids(first.id)
+
+    def test_versions(self):
+        first, second = self.profiles[:2]
+        trusting = FollowCache(max_users=10, recheck_interval=60)
+        checking = FollowCache(max_users=10, recheck_interval=0)
+        for local in (trusting, checking):
+            self.assertFalse(local.is_following(first.id, second.id))
+
+        first.follow(second)
+        # Within the interval the list is answered without looking at the version
+        self.assertFalse(trusting.is_following(first.id, second.id))
+        self.assertTrue(checking.is_following(first.id, second.id))
+        with self.assertNumQueries(0):
+            checking.is_following(first.id, second.id)
+
+    @override_settings(FOLLOW_CACHE_ENABLED=True, FOLLOW_CACHE_RECHECK_INTERVAL=60)
+    def test_own_changes_are_seen_at_once(self):
+        first, second = self.profiles[:2]
+        self.assertFalse(first.is_following(second))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.follow(second)
+        self.assertTrue(first.is_following(second))
+        first.unfollow(second)
+        self.assertFalse(first.is_following(second))
+
+
+class FollowSuggestionTests(TestCase):
+    """Friends-of-friends suggestions and their stale refresh"""
+
+    def setUp(self):
+        self.a, self.b, self.c, self.d, self.e, self.f = [
+            User.objects.create_user(name).profile for name in 'abcdef'
+        ]
+        for follower, followee in [
+            (self.a, self.b), (self.a, self.c), (self.b, self.d), (self.c, self.d),
+            (self.b, self.f), (self.c, self.e), (self.c, self.a),
+        ]:
+            follower.follow(followee)
+
+    def suggested(self, profile):
+        return [(suggested.id, count) for suggested, count in get_suggestions(profile)]
+
+    def test_ranking(self):
+        graph = FollowGraph.load()
+        # Most mutual follows first, the older account on ties, never itself
+        # or someone already followed
+        self.assertEqual(graph.suggest(self.a.id, 10), [[self.d.id, 2], [self.e.id, 1], [self.f.id, 1]])
+        self.assertEqual(graph.suggest(self.a.id, 2), [[self.d.id, 2], [self.e.id, 1]])
+        self.assertEqual(graph.suggest(self.d.id, 10), [])
+
+    def test_stale_refresh(self):
+        self.assertEqual(compute_suggestions(), 6)
+        self.assertEqual(self.suggested(self.a), [(self.d.id, 2), (self.e.id, 1), (self.f.id, 1)])
+        self.assertEqual(compute_suggestions(), 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.b.follow(self.e)
+        # Marked only once the follow has committed
+        self.assertFalse(FollowSuggestion.objects.filter(stale=True).exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            set(FollowSuggestion.objects.filter(stale=True).values_list('profile_id', flat=True)),
+            {self.a.id, self.b.id},
+        )
+
+        self.assertEqual(compute_suggestions(), 2)
+        self.assertEqual(self.suggested(self.a), [(self.d.id, 2), (self.e.id, 2), (self.f.id, 1)])
+        # Following a suggestion hides it before the next computation
+        self.a.follow(self.e)
+        self.assertEqual(self.suggested(self.a), [(self.d.id, 2), (self.f.id, 1)])
+
+
+class CommentTreeTests(TestCase):
+    """Materialized-path comment threads"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('commenter')
+        self.post = Post.objects.create(user=self.user, content='Post')
+
+    def comment(self, content, parent=None):
+        return Comment.objects.create(post=self.post, user=self.user, content=content, parent=parent)
+
+    def thread(self, path=''):
+        return [comment.content for comment in Comment.thread_of(self.post.id, path)]
+
+    def test_thread_is_depth_first(self):
+        first = self.comment('1')
+        second = self.comment('2')
+        reply = self.comment('1.1', first)
+        self.comment('2.1', second)
+        self.comment('1.1.1', reply)
+        self.comment('1.2', first)
+
+        self.assertEqual(self.thread(), ['1', '1.1', '1.1.1', '1.2', '2', '2.1'])
+        self.assertEqual([c.depth for c in Comment.thread_of(self.post.id)], [0, 1, 2, 1, 0, 1])
+        first.refresh_from_db()
+        self.assertEqual(first.reply_count, 2)
+        # A subtree is its root and everything below, and nothing of the siblings
+        self.assertEqual([c.content for c in first.get_thread()], ['1', '1.1', '1.1.1', '1.2'])
+        self.assertEqual([c.content for c in reply.get_thread()], ['1.1', '1.1.1'])
+
+    def test_replies_past_max_depth_attach_to_grandparent(self):
+        parent = None
+        for depth in range(Comment.MAX_DEPTH + 1):
+            parent = self.comment(f'level {depth}', parent)
+        self.assertEqual(parent.depth, Comment.MAX_DEPTH)
+
+        too_deep = self.comment('too deep', parent)
+        self.assertEqual(too_deep.depth, Comment.MAX_DEPTH)
+        self.assertEqual(too_deep.parent_id, parent.parent_id)
+        self.assertLessEqual(len(too_deep.path), Comment._meta.get_field('path').max_length)
+
+    def test_delete_removes_subtree_and_counts(self):
+        first = self.comment('1')
+        reply = self.comment('1.1', first)
+        self.comment('1.1.1', reply)
+        self.comment('2')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 4)
+
+        reply.delete()
+        self.assertEqual(self.thread(), ['1', '2'])
+        self.post.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual((self.post.comments_count, first.reply_count), (2, 0))
+
+    def test_thread_view(self):
+        first = self.comment('1')
+        self.comment('1.1', first)
+        self.comment('2')
+        url = reverse('comment_thread', args=[self.post.id])
+        response = self.client.get(url, {'root': first.id})
+        self.assertEqual([c['content'] for c in response.json()['comments']], ['1', '1.1'])
+        self.assertEqual(self.client.get(url, {'root': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'root': first.id + 100}).status_code, 404)
+
+    def test_reply_with_bad_parent(self):
+        first = self.comment('1')
+        self.client.force_login(self.user)
+        url = reverse('add_comment', args=[self.post.id])
+        self.assertEqual(self.client.post(url, {'content': 'Hi', 'parent_id': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'content': 'Hi', 'parent_id': first.id + 100}).status_code, 404)
+        self.assertTrue(self.client.post(url, {'content': 'Reply', 'parent_id': first.id}).json()['success'])
+        self.assertEqual(self.thread(), ['1', 'Reply'])
+
+
+class ToggleReactionTests(TestCase):
+    """Direct toggles keep the reaction rows and both counters in step"""
+
+    def setUp(self):
+        self.post = Post.objects.create(user=User.objects.create_user('author'), content='Post')
+        self.users = [User.objects.create_user(f'reactor{i}') for i in range(3)]
+
+    def assert_state(self, likes, dislikes):
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.dislikes_count), (likes, dislikes))
+        rows = Reaction.objects.filter(post=self.post)
+        self.assertEqual(rows.filter(kind=Reaction.LIKE).count(), likes)
+        self.assertEqual(rows.filter(kind=Reaction.DISLIKE).count(), dislikes)
+
+    def test_like_replaces_dislike(self):
+        user = self.users[0]
+        self.assertEqual(self.post.toggle_reaction(user, Reaction.DISLIKE), Reaction.DISLIKE)
+        self.assert_state(0, 1)
+        self.assertEqual(self.post.toggle_reaction(user, Reaction.LIKE), Reaction.LIKE)
+        self.assert_state(1, 0)
+        self.assertEqual(Reaction.objects.get(post=self.post, user=user).kind, Reaction.LIKE)
+        self.assertIsNone(self.post.toggle_reaction(user, Reaction.LIKE))
+        self.assert_state(0, 0)
+
+    def test_counters_follow_a_toggle_sequence(self):
+        expected = {}
+        rng = random.Random(7)
+        for _ in range(40):
+            user = rng.choice(self.users)
+            kind = rng.choice([Reaction.LIKE, Reaction.DISLIKE])
+            result = self.post.toggle_reaction(user, kind)
+            expected[user.id] = None if expected.get(user.id) == kind else kind
+            self.assertEqual(result, expected[user.id])
+            kinds = list(expected.values())
+            self.assert_state(kinds.count(Reaction.LIKE), kinds.count(Reaction.DISLIKE))
+
+
+class ReactionIndexTests(TestCase):
+    """The cached reaction index never outlives a toggle"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reactor')
+        author = User.objects.create_user('author')
+        self.posts = [Post.objects.create(user=author, content=f'Post {i}') for i in range(3)]
+        self.ids = [post.id for post in self.posts]
+
+    def test_toggles_invalidate(self):
+        self.posts[0].toggle_reaction(self.user, Reaction.LIKE)
+        self.assertEqual(get_reaction_index(self.user.id).kinds_of(self.ids), {self.ids[0]: Reaction.LIKE})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[0].toggle_reaction(self.user, Reaction.DISLIKE)
+            self.posts[2].toggle_reaction(self.user, Reaction.LIKE)
+        self.assertEqual(get_reaction_index(self.user.id).kinds_of(self.ids), {
+            self.ids[0]: Reaction.DISLIKE, self.ids[2]: Reaction.LIKE,
+        })
+
+    def test_build_racing_a_toggle_is_not_served(self):
+        stale = get_reaction_index(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[1].toggle_reaction(self.user, Reaction.LIKE)
+            # A concurrent reader saw the new version but the rows from before
+            # the commit, and stores its index after the toggle's invalidation
+            current = cache.get(reaction_version_key(self.user.id))
+            cache.set(reaction_index_key(self.user.id), (current, stale))
+        self.assertEqual(get_reaction_index(self.user.id).kinds_of(self.ids), {self.ids[1]: Reaction.LIKE})
+
+
+class ReactionBufferTests(TestCase):
+    """Buffered toggles must end in the same state as applying them one by one"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(f'user{i}') for i in range(6)]
+        author = self.users[0]
+        self.serial_posts = [Post.objects.create(user=author, content='serial') for _ in range(3)]
+        self.buffered_posts = [Post.objects.create(user=author, content='buffered') for _ in range(3)]
+
+    def final_state(self, posts):
+        reactions = sorted(
+            (posts.index(post), user_id, kind)
+            for post in posts
+            for user_id, kind in post.reactions.values_list('user_id', 'kind')
+        )
+        counts = [
+            Post.objects.values_list('likes_count', 'dislikes_count').get(id=post.id)
+            for post in posts
+        ]
+        return reactions, counts
+
+    def test_final_state_matches_serial(self):
+        rng = random.Random(7)
+        operations = [
+            (rng.randrange(3), rng.choice(self.users), rng.choice([Reaction.LIKE, Reaction.DISLIKE]))
+            for _ in range(300)
+        ]
+        buffer = ReactionBuffer()
+        for i, (index, user, kind) in enumerate(operations):
+            expected = self.serial_posts[index].toggle_reaction(user, kind)
+            self.assertEqual(buffer.toggle(self.buffered_posts[index], user, kind), expected)
+            if i % 37 == 0:
+                buffer.flush()
+
+        for serial, buffered in zip(self.serial_posts, self.buffered_posts):
+            buffered.refresh_from_db()
+            self.assertEqual(
+                buffer.optimistic_counts(buffered),
+                (serial.likes_count, serial.dislikes_count),
+            )
+        buffer.flush()
+        self.assertEqual(self.final_state(self.buffered_posts), self.final_state(self.serial_posts))
+
+    def test_workers_share_the_buffer(self):
+        post = self.buffered_posts[0]
+        user = self.users[1]
+        first, second = ReactionBuffer(), ReactionBuffer()
+        self.assertEqual(first.toggle(post, user, Reaction.LIKE), Reaction.LIKE)
+        # The other worker sees the buffered like, so this undoes it
+        self.assertEqual(second.toggle(post, user, Reaction.LIKE), None)
+        self.assertEqual(second.toggle(post, user, Reaction.DISLIKE), Reaction.DISLIKE)
+        self.assertEqual(first.buffered_kinds(user.id, [post.id]), {post.id: Reaction.DISLIKE})
+        for buffer in (first, second):
+            self.assertEqual(buffer.optimistic_counts(post), (0, 1))
+
+        self.assertEqual(first.flush(), 1)
+        self.assertEqual(second.flush(), 0)
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.dislikes_count), (0, 1))
+        self.assertEqual(second.optimistic_counts(post), (0, 1))
+        self.assertEqual(second.toggle(post, user, Reaction.DISLIKE), None)
+
+    def test_toggles_outlive_their_worker(self):
+        post = self.buffered_posts[0]
+        crashed = ReactionBuffer()
+        crashed.toggle(post, self.users[1], Reaction.LIKE)
+        crashed.toggle(post, self.users[2], Reaction.DISLIKE)
+        crashed.toggle(post, self.users[2], Reaction.LIKE)
+        self.assertFalse(post.reactions.exists())
+
+        # Any other worker's flush writes what the dead one acknowledged
+        self.assertEqual(ReactionBuffer().flush(), 2)
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.dislikes_count), (2, 0))
+        self.assertEqual(set(post.reactions.values_list('kind', flat=True)), {Reaction.LIKE})
+
+
+class ReactionBatchTests(TestCase):
+    """A batch of toggles costs the same handful of queries at any size"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reactor', password='secret')
+        self.posts = [Post.objects.create(user=self.user, content=f'Post {i}') for i in range(30)]
+        self.client.force_login(self.user)
+
+    def post_batch(self, operations):
+        return self.client.post(
+            reverse('reaction_batch'),
+            json.dumps({'operations': operations}),
+            content_type='application/json',
+        )
+
+    def test_query_count_is_constant(self):
+        # Session, user, posts, stored reactions, then in a savepoint the
+        # reactions read, DELETE, UPDATE, INSERT, counters UPDATE, rank
+        # SELECT and UPDATE; and the final counts
+        self.posts[0].toggle_reaction(self.user, Reaction.LIKE)
+        self.posts[1].toggle_reaction(self.user, Reaction.LIKE)
+        self.posts[2].toggle_reaction(self.user, Reaction.DISLIKE)
+        operations = (
+            [{'post_id': post.id, 'action': 'like'} for post in self.posts[:25]]
+            + [{'post_id': post.id, 'action': 'dislike'} for post in self.posts[3:28]]
+        )
+        with self.assertNumQueries(14):
+            response = self.post_batch(operations)
+        self.assertEqual(len(response.json()['results']), 50)
+
+    def test_counts_follow_the_toggles(self):
+        first, second = self.posts[:2]
+        response = self.post_batch([
+            {'post_id': first.id, 'action': 'like'},
+            {'post_id': second.id, 'action': 'dislike'},
+            {'post_id': first.id, 'action': 'dislike'},
+        ])
+        counts = response.json()['counts']
+        self.assertEqual(counts[str(first.id)], {'likes_count': 0, 'dislikes_count': 1})
+        self.assertEqual(counts[str(second.id)], {'likes_count': 0, 'dislikes_count': 1})
+        for post in (first, second):
+            post.refresh_from_db()
+            self.assertEqual((post.likes_count, post.dislikes_count), (0, 1))
+            self.assertGreater(post.rank_score, 0)
+            self.assertEqual(post.version, 2)
+
+
+class ReconcileCountersTests(TestCase):
+    def reconcile(self, command, *args):
+        out = StringIO()
+        call_command(command, *args, stdout=out)
+        return out.getvalue()
+
+    def test_post_counters(self):
+        user = User.objects.create_user('author')
+        post = Post.objects.create(user=user, content='Post')
+        post.toggle_reaction(user, Reaction.LIKE)
+        Post.objects.filter(id=post.id).update(likes_count=5, comments_count=2, rank_score=100)
+
+        self.assertIn('Found 1', self.reconcile('reconcile_post_counters', '--dry-run'))
+        version = Post.objects.values_list('version', flat=True).get(id=post.id)
+        self.assertIn('Repaired 1', self.reconcile('reconcile_post_counters', '--batch-size', '1'))
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.dislikes_count, post.comments_count), (1, 0, 0))
+        # Cached cards and the Top feed follow the repaired counters
+        self.assertEqual(post.version, version + 1)
+        self.assertAlmostEqual(post.rank_score, post.compute_rank_score(), places=3)
+        self.assertIn('Repaired 0', self.reconcile('reconcile_post_counters'))
+
+    def test_follow_counts(self):
+        alice = User.objects.create_user('alice').profile
+        bob = User.objects.create_user('bob').profile
+        alice.follow(bob)
+        UserProfile.objects.filter(id=bob.id).update(followers_count=0, following_count=3)
+
+        self.assertIn('Repaired 1', self.reconcile('reconcile_follow_counts'))
+        bob.refresh_from_db()
+        self.assertEqual((bob.followers_count, bob.following_count), (1, 0))
+
+
+@override_settings(CHAT_HISTORY_PAGE_SIZE=3)
+class MessagePageTests(TestCase):
+    """Keyset paging over a conversation's messages"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.ids = [
+            self.conversation.post_message(self.alice if i % 2 else self.bob, f'Message {i}').id
+            for i in range(7)
+        ]
+
+    def page(self, **kwargs):
+        page, has_more = get_message_page(self.conversation.id, **kwargs)
+        return [message.id for message in page], has_more
+
+    def test_before_and_after(self):
+        ids = self.ids
+        self.assertEqual(self.page(), (ids[4:], True))
+        self.assertEqual(self.page(before_id=ids[4]), (ids[1:4], True))
+        self.assertEqual(self.page(before_id=ids[1]), (ids[:1], False))
+        self.assertEqual(self.page(after_id=ids[0]), (ids[1:4], True))
+        self.assertEqual(self.page(after_id=ids[3]), (ids[4:], False))
+        self.assertEqual(self.page(after_id=ids[6]), ([], False))
+        # The limit can shrink a page but not grow it past the page size
+        self.assertEqual(self.page(before_id=ids[4], limit=2), (ids[2:4], True))
+        self.assertEqual(self.page(limit=100), (ids[4:], True))
+
+    def test_invalid_cursor(self):
+        other = Conversation.objects.create()
+        foreign = other.post_message(self.alice, 'Elsewhere')
+        for kwargs in ({'before_id': foreign.id}, {'after_id': foreign.id}, {'before_id': self.ids[-1] + 100}):
+            with self.assertRaises(InvalidCursor):
+                get_message_page(self.conversation.id, **kwargs)
+
+
+class MessageBatchTests(TestCase):
+    """A written batch must look exactly like posting its messages one by one"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(name) for name in ('alice', 'bob', 'carol')]
+
+    def conversation(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(*self.users)
+        # Some history so the batch starts from a mixed read state
+        alice, bob, carol = self.users
+        conversation.post_message(alice, 'Earlier')
+        conversation.post_message(bob, 'Earlier reply')
+        conversation.mark_read(carol)
+        return conversation
+
+    def snapshot(self, conversation):
+        messages = list(Message.objects.filter(conversation=conversation).order_by('id'))
+        positions = {message.id: position for position, message in enumerate(messages)}
+        members = ConversationMember.objects.filter(conversation=conversation).order_by('user_id')
+        conversation.refresh_from_db()
+        return {
+            'messages': [(message.sender_id, message.content) for message in messages],
+            'members': [
+                (member.user_id, positions.get(member.last_read_message_id), member.unread_count)
+                for member in members
+            ],
+            'updated_at_is_last_message': conversation.updated_at == messages[-1].created_at,
+        }
+
+    def test_matches_post_message(self):
+        alice, bob, carol = self.users
+        script = [(0, alice, 'a1'), (1, bob, 'b1'), (0, bob, 'b2'), (0, alice, 'a2'),
+                  (1, bob, 'b3'), (0, bob, 'b4'), (1, alice, 'a3')]
+
+        one_by_one = [self.conversation(), self.conversation()]
+        for index, sender, content in script:
+            one_by_one[index].post_message(sender, content)
+
+        batched = [self.conversation(), self.conversation()]
+        saved = write_message_batch([(batched[index].id, sender, content) for index, sender, content in script])
+        self.assertEqual([message.content for message in saved], [content for _, _, content in script])
+        self.assertTrue(all(message.id for message in saved))
+
+        for expected, actual in zip(one_by_one, batched):
+            self.assertEqual(self.snapshot(actual), self.snapshot(expected))
+        self.assertTrue(self.snapshot(batched[0])['updated_at_is_last_message'])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CHAT_TYPING_INTERVAL=0.25,
+    CHAT_READ_RECEIPT_INTERVAL=0.25,
+)
+class ChatConsumerTests(TransactionTestCase):
+    """Typing, presence and read receipts over the socket"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+
+    async def connect(self, user):
+        socket = ApplicationCommunicator(ChatConsumer.as_asgi(), {
+            'type': 'websocket',
+            'path': f'/ws/chat/{self.conversation.id}/',
+            'url_route': {'kwargs': {'conversation_id': self.conversation.id}},
+            'user': user,
+        })
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output())['type'], 'websocket.accept')
+        return socket
+
+    async def send(self, socket, data):
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive(self, socket):
+        return json.loads((await socket.receive_output())['text'])
+
+    async def disconnect(self, socket):
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait()
+
+    async def test_presence_and_typing(self):
+        alice = await self.connect(self.alice)
+        self.assertEqual(await self.receive(alice), {
+            'type': 'presence', 'online': [self.alice.id], 'heartbeat': 15.0,
+        })
+        bob = await self.connect(self.bob)
+        self.assertEqual((await self.receive(bob))['online'], [self.alice.id, self.bob.id])
+        self.assertEqual(await self.receive(alice), {
+            'type': 'presence', 'user_id': self.bob.id, 'online': True,
+        })
+        # Heartbeats right after connecting are ignored
+        await self.send(bob, {'type': 'presence'})
+        self.assertTrue(await bob.receive_nothing(0.05))
+
+        await self.send(alice, {'typing': True})
+        self.assertEqual(await self.receive(bob), {
+            'type': 'typing', 'sender_id': self.alice.id, 'typing': True, 'ttl': 0.75,
+        })
+        # A short pause is swallowed, and so is the typing that follows it
+        await self.send(alice, {'typing': False})
+        await self.send(alice, {'typing': True})
+        self.assertTrue(await bob.receive_nothing(0.1))
+        # A pause of a whole interval reaches the room
+        await self.send(alice, {'typing': False})
+        self.assertFalse((await self.receive(bob))['typing'])
+        # Senders don't hear their own typing
+        self.assertTrue(await alice.receive_nothing(0.05))
+
+        await self.disconnect(alice)
+        self.assertEqual(await self.receive(bob), {
+            'type': 'presence', 'user_id': self.alice.id, 'online': False,
+        })
+        await self.disconnect(bob)
+        self.assertEqual(await Message.objects.acount(), 0)
+
+    async def test_read_receipts_are_debounced(self):
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob)
+        # Presence on connect
+        await self.receive(alice)
+        await self.receive(alice)
+        await self.receive(bob)
+        post = sync_to_async(self.conversation.post_message)
+        sent = [await post(self.bob, f'Message {i}') for i in range(3)]
+
+        # The first report is written at once, the next two become one write
+        for message in sent:
+            await self.send(alice, {'type': 'read', 'message_id': message.id})
+        self.assertEqual(await self.receive(bob), {
+            'type': 'read', 'user_id': self.alice.id, 'message_id': sent[0].id,
+        })
+        self.assertTrue(await bob.receive_nothing(0.1))
+        self.assertEqual((await self.receive(bob))['message_id'], sent[2].id)
+
+        # IDs past the last message are capped to it, so nothing moves
+        await self.send(alice, {'type': 'read', 'message_id': sent[2].id + 1000})
+        self.assertTrue(await bob.receive_nothing(0.4))
+        member = await ConversationMember.objects.aget(conversation=self.conversation, user=self.alice)
+        self.assertEqual((member.last_read_message_id, member.unread_count), (sent[2].id, 0))
+
+        await self.disconnect(alice)
+        await self.disconnect(bob)
+
+    async def test_history_frames(self):
+        post = sync_to_async(self.conversation.post_message)
+        sent = [await post(self.bob, f'Message {i}') for i in range(3)]
+        alice = await self.connect(self.alice)
+        await self.receive(alice)
+
+        await self.send(alice, {'type': 'history', 'before_id': sent[2].id})
+        history = await self.receive(alice)
+        self.assertEqual([m['message_id'] for m in history['messages']], [sent[0].id, sent[1].id])
+        self.assertFalse(history['has_more'])
+        await self.send(alice, {'type': 'history', 'after_id': sent[0].id, 'limit': 1})
+        history = await self.receive(alice)
+        self.assertEqual(([m['message'] for m in history['messages']], history['has_more']), (['Message 1'], True))
+
+        for bad in ({'before_id': 'abc'}, {'after_id': sent[2].id + 100}):
+            await self.send(alice, {'type': 'history', **bad})
+            self.assertEqual(await self.receive(alice), {'error': 'Invalid cursor'})
+        await self.disconnect(alice)
+
+
+class MalformedCursorTests(TestCase):
+    """Tampered cursors are a 400 on every paginated endpoint, not a 500"""
+
+    CURSORS = [
+        encode_cursor(['garbage', 1]),
+        encode_cursor(['2024-01-01 00:00:00', 'abc']),
+        encode_cursor([{'a': 1}, 1]),
+        encode_cursor(['2024-01-01 00:00:00', True]),
+        encode_cursor([1, 2, 3]),
+        'not a cursor',
+    ]
+
+    def setUp(self):
+        cache.clear()
+        cache.set('daily_quote', 'Test quote - Tester', None)
+        self.user = User.objects.create_user('reader', password='secret')
+        self.post = Post.objects.create(user=self.user, content='Post')
+        self.client.force_login(self.user)
+
+    def test_paginated_endpoints(self):
+        urls = [
+            reverse('post_list_more'),
+            reverse('post_list_more') + '?feed=top',
+            reverse('post_list_more') + '?feed=following',
+            reverse('api_posts'),
+            reverse('comment_list', args=[self.post.id]),
+            reverse('followers_list', args=[self.user.username]),
+            reverse('following_list', args=[self.user.username]),
+            reverse('conversations_list'),
+        ]
+        for url in urls:
+            for cursor in self.CURSORS:
+                with self.subTest(url=url, cursor=cursor):
+                    separator = '&' if '?' in url else '?'
+                    response = self.client.get(f'{url}{separator}cursor={cursor}')
+                    self.assertEqual(response.status_code, 400)
+
+    def test_valid_cursor_still_pages(self):
+        newer = Post.objects.create(user=self.user, content='Newer')
+        cursor = encode_cursor([newer.created_at, newer.id])
+        response = self.client.get(reverse('api_posts') + f'?cursor={cursor}&fields=id')
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([post['id'] for post in body['results']], [self.post.id])
+
+
+class ApiPostsTests(TestCase):
+    """The streamed JSON feed: chunking, limits, fields and cursors"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('author')
+        Post.objects.bulk_create(Post(user=self.user, content=f'Post {i}') for i in range(450))
+        self.newest_first = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def get(self, **params):
+        response = self.client.get(reverse('api_posts'), params)
+        self.assertEqual(response.status_code, 200)
+        parts = list(response.streaming_content)
+        return json.loads(b''.join(parts)), len(parts)
+
+    def test_results_span_several_chunks(self):
+        body, parts = self.get(limit=450)
+        # Opening, three chunks of rows, closing with the cursor
+        self.assertEqual(parts, 5)
+        self.assertEqual([post['id'] for post in body['results']], self.newest_first)
+        self.assertIsNone(body['next_cursor'])
+        self.assertEqual(body['results'][0]['user'], 'author')
+
+    @override_settings(API_MAX_PAGE_SIZE=5)
+    def test_limit(self):
+        body, _ = self.get(limit=100)
+        self.assertEqual(len(body['results']), 5)
+        self.assertIsNotNone(body['next_cursor'])
+        for limit in ('0', '-3', 'abc'):
+            self.assertEqual(self.client.get(reverse('api_posts'), {'limit': limit}).status_code, 400)
+
+    def test_fields(self):
+        body, _ = self.get(limit=3, fields='id,likes_count,photo')
+        self.assertEqual(body['results'][0], {'id': self.newest_first[0], 'likes_count': 0, 'photo': None})
+        response = self.client.get(reverse('api_posts'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_cursor_round_trip(self):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 120, 'fields': 'id'}
+            if cursor:
+                params['cursor'] = cursor
+            body, _ = self.get(**params)
+            seen.extend(post['id'] for post in body['results'])
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.newest_first)
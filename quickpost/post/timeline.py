@@ -0,0 +1,172 @@
+import heapq
+import logging
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .feed import attach_viewer_state, encode_cursor, feed_page_size, feed_queryset, keyset_filter
+from .models import Post, TimelineEntry, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT when fanning a post out to followers
+FANOUT_BATCH_SIZE = 1000
+
+
+def timeline_max_length():
+    """Number of entries kept per home timeline"""
+    return getattr(settings, 'TIMELINE_MAX_LENGTH', 800)
+
+
+def timeline_backfill_size():
+    """Number of recent posts copied into a timeline on follow"""
+    return getattr(settings, 'TIMELINE_BACKFILL_SIZE', 50)
+
+
+def fanout_follower_limit():
+    """
+    Accounts with more followers than this are not fanned out on write,
+    their posts are pulled into followers' timelines at read time instead.
+    """
+    return getattr(settings, 'TIMELINE_FANOUT_FOLLOWER_LIMIT', 10000)
+
+
+def is_pulled_author(author_id):
+    """Check if an author's posts are merged in at read time"""
+    profile = UserProfile.objects.filter(user_id=author_id) \
+        .values_list('followers_count', 'timeline_pulled').first()
+    return profile is not None and (profile[1] or profile[0] > fanout_follower_limit())
+
+
+def mark_pulled_author(profile):
+    """
+    Remember that ``profile`` crossed the fan-out limit. It stays pulled
+    when it drops back under, as the posts it wrote meanwhile were never
+    pushed to anyone.
+    """
+    if not profile.timeline_pulled and profile.followers_count > fanout_follower_limit():
+        UserProfile.objects.filter(pk=profile.pk).update(timeline_pulled=True)
+        profile.timeline_pulled = True
+
+
+def pulled_author_ids(viewer_id):
+    """IDs of the high-follower accounts ``viewer_id`` follows"""
+    return list(
+        UserProfile.following.through.objects.filter(
+            Q(to_userprofile__timeline_pulled=True)
+            | Q(to_userprofile__followers_count__gt=fanout_follower_limit()),
+            from_userprofile__user_id=viewer_id,
+        ).values_list('to_userprofile__user_id', flat=True)
+    )
+
+
+def follower_user_ids(author_id):
+    """IDs of the users following ``author_id``"""
+    return UserProfile.following.through.objects.filter(
+        to_userprofile__user_id=author_id
+    ).values_list('from_userprofile__user_id', flat=True)
+
+
+def _entries_for(post, owner_ids):
+    return [
+        TimelineEntry(owner_id=owner_id, post_id=post.id,
+                      author_id=post.user_id, created_at=post.created_at)
+        for owner_id in owner_ids
+    ]
+
+
+def fan_out_post(post):
+    """Deliver a newly created post to its author's and followers' timelines"""
+    owner_ids = [post.user_id]
+    if not is_pulled_author(post.user_id):
+        owner_ids.extend(follower_user_ids(post.user_id).iterator(chunk_size=FANOUT_BATCH_SIZE))
+
+    for start in range(0, len(owner_ids), FANOUT_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(
+            _entries_for(post, owner_ids[start:start + FANOUT_BATCH_SIZE]),
+            ignore_conflicts=True,
+        )
+    logger.info(f"Fanned out post {post.id} to {len(owner_ids)} timelines")
+
+
+def backfill_timeline(owner_id, author_id):
+    """Copy an author's recent posts into a new follower's timeline"""
+    if owner_id != author_id and is_pulled_author(author_id):
+        return
+    posts = Post.objects.filter(user_id=author_id).order_by('-created_at', '-id')
+    entries = []
+    for post in posts.only('id', 'user_id', 'created_at')[:timeline_backfill_size()]:
+        entries.extend(_entries_for(post, [owner_id]))
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def remove_author_from_timeline(owner_id, author_id):
+    """Drop an unfollowed author's posts from a timeline"""
+    TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+
+
+def trim_timelines():
+    """Cut every timeline back to TIMELINE_MAX_LENGTH entries"""
+    max_length = timeline_max_length()
+    oversized = list(
+        TimelineEntry.objects.values('owner_id').order_by()
+        .annotate(n=Count('id')).filter(n__gt=max_length)
+        .values_list('owner_id', flat=True)
+    )
+    trimmed = 0
+    for owner_id in oversized:
+        entries = TimelineEntry.objects.filter(owner_id=owner_id).order_by('-created_at', '-id')
+        # Sort key of the oldest entry that stays
+        created_at, entry_id = entries.values_list('created_at', 'id')[max_length - 1]
+        deleted, _ = entries.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=entry_id)
+        ).delete()
+        trimmed += deleted
+    return trimmed
+
+
+def pulled_posts(author_ids, cursor, page_size):
+    """
+    ``(created_at, id)`` of the next ``page_size + 1`` posts by the pulled
+    ``author_ids``, read along the (user, created_at, id) index
+    """
+    return keyset_filter(Post.objects.filter(user_id__in=author_ids), cursor) \
+        .values_list('created_at', 'id')[:page_size + 1]
+
+
+def get_timeline_page(viewer, cursor=None, page_size=None):
+    """
+    Get one page of ``viewer``'s home timeline.
+
+    Posts pushed into the viewer's timeline entries are merged by
+    ``(created_at, id)`` with posts pulled from the high-follower accounts
+    they follow, each side being one bounded range scan. The posts
+    themselves are then fetched with a single ``id__in`` query.
+    """
+    page_size = page_size or feed_page_size()
+    streams = [
+        keyset_filter(
+            TimelineEntry.objects.filter(owner=viewer), cursor, tiebreak='post_id'
+        ).values_list('created_at', 'post_id')[:page_size + 1],
+    ]
+    pulled_ids = pulled_author_ids(viewer.id)
+    if pulled_ids:
+        streams.append(pulled_posts(pulled_ids, cursor, page_size))
+
+    keys, seen = [], set()
+    for created_at, post_id in heapq.merge(*streams, reverse=True):
+        # A post can be in both streams if its author crossed the limit
+        if post_id not in seen:
+            seen.add(post_id)
+            keys.append((created_at, post_id))
+            if len(keys) > page_size:
+                break
+
+    next_cursor = None
+    if len(keys) > page_size:
+        keys = keys[:page_size]
+        next_cursor = encode_cursor(list(keys[-1]))
+
+    posts_by_id = feed_queryset().in_bulk([post_id for _, post_id in keys])
+    posts = [posts_by_id[post_id] for _, post_id in keys if post_id in posts_by_id]
+    return attach_viewer_state(posts, viewer), next_cursor
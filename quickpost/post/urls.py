@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('', views.post_list, name='post_list'),
+    path('feed/more/', views.post_list_more, name='post_list_more'),
+    path('api/posts/', views.api_posts, name='api_posts'),
     path('create/', views.create_post, name='create_post'),
     path('edit/<int:post_id>/', views.edit_post, name='edit_post'),
     path('delete/<int:post_id>/', views.delete_post, name='delete_post'),
@@ -11,9 +13,14 @@ urlpatterns = [
     #path('profile/', views.profile, name='profile'),    
     path('like/<int:post_id>/', views.like_post, name='like_post'),  # Assuming you have a like post view
     path('dislike/<int:post_id>/', views.dislike_post, name='dislike_post'),  # Assuming you have a dislike post view
+    path('reactions/batch/', views.reaction_batch, name='reaction_batch'),
     path('comment/<int:post_id>/', views.add_comment, name='add_comment'),  # Assuming you have a comment view
+    path('comments/<int:post_id>/', views.comment_list, name='comment_list'),
+    path('comments/<int:post_id>/thread/', views.comment_thread, name='comment_thread'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),  # Must come before username pattern
     path('follow/<str:username>/', views.toggle_follow, name='toggle_follow'),
+    path('suggestions/', views.follow_suggestions, name='follow_suggestions'),
+    path('follow-cache/stats/', views.follow_cache_stats, name='follow_cache_stats'),
     path('profile/<str:username>/followers/', views.followers_list, name='followers_list'),
     path('profile/<str:username>/following/', views.following_list, name='following_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
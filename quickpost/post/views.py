@@ -1,20 +1,36 @@
 from django.shortcuts import redirect, render
-from .models import Post , Comment, UserProfile, Conversation, Message
+from .models import Post , Comment, UserProfile, Conversation, ConversationMember, Message, Reaction
 from .forms import PostForm, UserRegistrationForm, UserUpdateForm, ProfileUpdateForm
+from .chat import get_message_page
+from .feed import (
+    encode_cursor, feed_page_size, get_comments_page, get_feed_page, get_top_page,
+    keyset_filter, paginate, InvalidCursor,
+)
+from .follow_cache import follow_cache, follow_cache_enabled
+from .fragments import render_post_cards
+from .reactions import apply_reaction_batch, get_reaction_buffer, reaction_batch_max_size
+from .suggestions import get_suggestions
+from .timeline import fan_out_post, get_timeline_page
 from django.contrib.auth.decorators import login_required 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.views.decorators.http import require_POST
+from django.utils.timesince import timesince
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.core.cache import cache
-from django.db.models import Max
+from django.conf import settings
+from django.db.models import Count, Min, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from google import genai
 import os
 from dotenv import load_dotenv
 import re
+import json
 
 load_dotenv()
 # @login_required
@@ -45,8 +61,114 @@ def post_list(request):
         'author': quote_parts[1] if len(quote_parts) > 1 else 'Unknown'
     }
     
-    posts = Post.objects.all().order_by('-created_at')
-    return render(request, 'post_list.html', {'posts': posts, 'daily_quote': quote_obj})
+    feed = _selected_feed(request)
+    posts, next_cursor = _get_posts_page(request, feed)
+    return render(request, 'post_list.html', {
+        'posts': posts,
+        'post_cards': render_post_cards(posts, request),
+        'feed': feed,
+        'next_cursor': next_cursor,
+        'daily_quote': quote_obj,
+    })
+
+def _selected_feed(request):
+    """Feed requested via ?feed=, the following feed needs a login"""
+    feed = request.GET.get('feed', 'all')
+    if feed == 'top' or (feed == 'following' and request.user.is_authenticated):
+        return feed
+    return 'all'
+
+def _get_posts_page(request, feed, cursor=None):
+    if feed == 'following':
+        return get_timeline_page(request.user, cursor)
+    if feed == 'top':
+        return get_top_page(request.user, cursor)
+    return get_feed_page(request.user, cursor)
+
+def post_list_more(request):
+    """Return the next page of the feed as rendered post cards"""
+    try:
+        posts, next_cursor = _get_posts_page(
+            request, _selected_feed(request), request.GET.get('cursor')
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({'html': render_post_cards(posts, request), 'next_cursor': next_cursor})
+
+# Fields the JSON feed can return, mapped to the columns they are read from
+API_POST_FIELDS = {
+    'id': 'id',
+    'user': 'user__username',
+    'content': 'content',
+    'photo': 'photo',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'likes_count': 'likes_count',
+    'dislikes_count': 'dislikes_count',
+    'comments_count': 'comments_count',
+}
+
+# Rows fetched from the database and written to the response per chunk
+API_CHUNK_SIZE = 200
+
+def api_posts(request):
+    """
+    Stream a page of posts as JSON.
+
+    Query parameters: ``cursor`` from the previous page, ``limit`` (up to
+    API_MAX_PAGE_SIZE) and ``fields``, a comma separated subset of
+    API_POST_FIELDS. Rows are read with ``.iterator()`` and written out in
+    chunks, so neither side holds the whole page in memory.
+    """
+    fields = request.GET.get('fields')
+    fields = fields.split(',') if fields else list(API_POST_FIELDS)
+    unknown = [field for field in fields if field not in API_POST_FIELDS]
+    if unknown:
+        return JsonResponse({'error': f'Unknown fields: {", ".join(unknown)}'}, status=400)
+
+    max_limit = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+    try:
+        limit = min(int(request.GET.get('limit', feed_page_size())), max_limit)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    try:
+        posts = keyset_filter(Post.objects.all(), request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # The cursor is built from created_at and id even when they aren't requested
+    columns = {API_POST_FIELDS[field] for field in fields} | {'id', 'created_at'}
+    rows = posts.values(*columns)[:limit + 1].iterator(chunk_size=API_CHUNK_SIZE)
+    return StreamingHttpResponse(
+        _stream_posts(rows, fields, limit), content_type='application/json'
+    )
+
+def _stream_posts(rows, fields, limit):
+    yield '{"results":['
+    chunk, sent, last, has_more = [], 0, None, False
+    for row in rows:
+        if sent == limit:
+            # The extra row only tells us there is another page
+            has_more = True
+            break
+        item = {field: row[API_POST_FIELDS[field]] for field in fields}
+        if 'photo' in item:
+            item['photo'] = settings.MEDIA_URL + item['photo'] if item['photo'] else None
+        chunk.append(json.dumps(item, cls=DjangoJSONEncoder))
+        sent += 1
+        last = row
+        if len(chunk) == API_CHUNK_SIZE:
+            yield ('' if sent == len(chunk) else ',') + ','.join(chunk)
+            chunk = []
+    if chunk:
+        yield ('' if sent == len(chunk) else ',') + ','.join(chunk)
+
+    next_cursor = encode_cursor([last['created_at'], last['id']]) if has_more else None
+    yield '],"next_cursor":' + json.dumps(next_cursor) + '}'
 
 #create post view
 @login_required
@@ -57,6 +179,7 @@ def create_post(request):
             post = form.save(commit=False)
             post.user = request.user
             post.save()
+            fan_out_post(post)
             return redirect('post_list')
     else:
         form = PostForm()
@@ -115,7 +238,7 @@ def home(request):
 @login_required
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(user=user).order_by('-created_at')
+    posts = Post.objects.filter(user=user).select_related('user__profile').order_by('-created_at')
     
     # Get or create profile
     profile, created = UserProfile.objects.get_or_create(user=user)
@@ -130,6 +253,7 @@ def profile(request, username):
         'profile_user': user,
         'profile': profile,
         'posts': posts,
+        'post_cards': render_post_cards(posts, request, variant='preview'),
         'is_own_profile': request.user == user,
         'is_following': is_following,
     }
@@ -163,18 +287,23 @@ def edit_profile(request):
 @login_required
 def like_post(request, post_id):
     if request.method == "POST":
-        post = Post.objects.get(id=post_id)
-        liked = False
+        try:
+            post = Post.objects.get(id=post_id)
+        except Post.DoesNotExist:
+            return JsonResponse({"error": "Post not found"}, status=404)
 
-        if request.user in post.likes.all():
-            post.likes.remove(request.user)
+        buffer = get_reaction_buffer()
+        if buffer is None:
+            liked = post.toggle_like(request.user)
+            likes_count, dislikes_count = post.likes_count, post.dislikes_count
         else:
-            post.likes.add(request.user)
-            liked = True
+            liked = buffer.toggle(post, request.user, Reaction.LIKE) == Reaction.LIKE
+            likes_count, dislikes_count = buffer.optimistic_counts(post)
 
         return JsonResponse({
             "liked": liked,
-            "likes_count": post.likes.count()
+            "likes_count": likes_count,
+            "dislikes_count": dislikes_count
         })
 
     return JsonResponse({"error": "Invalid request"}, status=400)
@@ -187,46 +316,138 @@ def dislike_post(request, post_id):
         except Post.DoesNotExist:
             return JsonResponse({"error": "Post not found"}, status=404)
 
-        disliked = False
-
-        if request.user in post.dislikes.all():
-            post.dislikes.remove(request.user)
+        buffer = get_reaction_buffer()
+        if buffer is None:
+            disliked = post.toggle_dislike(request.user)
+            likes_count, dislikes_count = post.likes_count, post.dislikes_count
         else:
-            post.dislikes.add(request.user)
-            disliked = True
-            # Remove like if it exists
-            if request.user in post.likes.all():
-                post.likes.remove(request.user)
+            disliked = buffer.toggle(post, request.user, Reaction.DISLIKE) == Reaction.DISLIKE
+            likes_count, dislikes_count = buffer.optimistic_counts(post)
 
         return JsonResponse({
             "disliked": disliked,
-            "dislikes_count": post.dislikes.count(),
-            "likes_count": post.likes.count()
+            "dislikes_count": dislikes_count,
+            "likes_count": likes_count
         })
 
     return JsonResponse({"error": "Invalid request"}, status=400)
 
+# Actions accepted by the batch endpoint
+REACTION_ACTIONS = {'like': Reaction.LIKE, 'dislike': Reaction.DISLIKE}
+
+@login_required
+@require_POST
+def reaction_batch(request):
+    """
+    Apply queued like/dislike toggles in one request.
+
+    Body: ``{"operations": [{"post_id": 1, "action": "like"}, ...]}``,
+    applied in order. Responds with one result per operation and the
+    updated counts of every post touched.
+    """
+    try:
+        operations = json.loads(request.body)['operations']
+        operations = [(int(op['post_id']), REACTION_ACTIONS[op['action']]) for op in operations]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid operations'}, status=400)
+    if len(operations) > reaction_batch_max_size():
+        return JsonResponse({'error': f'At most {reaction_batch_max_size()} operations per batch'}, status=400)
+
+    kinds, counts = apply_reaction_batch(request.user, operations)
+
+    results = []
+    for (post_id, action), kind in zip(operations, kinds):
+        if kind is False:
+            results.append({'post_id': post_id, 'error': 'Post not found'})
+        else:
+            results.append({
+                'post_id': post_id,
+                'action': action,
+                'liked': kind == Reaction.LIKE,
+                'disliked': kind == Reaction.DISLIKE,
+            })
+    return JsonResponse({
+        'results': results,
+        'counts': {
+            post_id: {'likes_count': likes, 'dislikes_count': dislikes}
+            for post_id, (likes, dislikes) in counts.items()
+        },
+    })
+
 @login_required
 def add_comment(request, post_id):
     if request.method == "POST":
         post = Post.objects.get(id=post_id)
         content = request.POST.get("content")
+        parent = None
+        if request.POST.get("parent_id"):
+            try:
+                parent_id = int(request.POST["parent_id"])
+            except ValueError:
+                return HttpResponseBadRequest("Invalid parent")
+            parent = get_object_or_404(Comment, id=parent_id, post=post)
         if content.strip():
             comment = Comment.objects.create(
                 post=post,
                 user=request.user,
-                content=content
+                content=content,
+                parent=parent
             )
             return JsonResponse({
                 "success": True,
                 "comment_user": comment.user.username,
                 "comment_content": comment.content,
                 "comment_time": comment.created_at.strftime("%b %d, %Y %H:%M"),
-                "comments_count": post.comments.count()
+                "comments_count": post.comments_count
             })
     return JsonResponse({"success": False})
 
 
+def _comment_json(comment):
+    profile_image = comment.user.profile.profile_image
+    return {
+        'id': comment.id,
+        'parent_id': comment.parent_id,
+        'user': comment.user.username,
+        'avatar': (
+            profile_image.url if profile_image
+            else f'https://ui-avatars.com/api/?name={comment.user.username}&background=random'
+        ),
+        'content': comment.content,
+        'depth': comment.depth,
+        'reply_count': comment.reply_count,
+        'created_at': comment.created_at.isoformat(),
+        'time_since': timesince(comment.created_at),
+    }
+
+def comment_list(request, post_id):
+    """Return one page of a post's comments, oldest first"""
+    post = get_object_or_404(Post, id=post_id)
+    try:
+        comments, next_cursor = get_comments_page(post, request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'comments': [_comment_json(comment) for comment in comments],
+        'next_cursor': next_cursor,
+    })
+
+def comment_thread(request, post_id):
+    """Return a post's comment tree, or the subtree under ?root=, depth-first"""
+    post = get_object_or_404(Post, id=post_id)
+    path = ''
+    if request.GET.get('root'):
+        try:
+            root_id = int(request.GET['root'])
+        except ValueError:
+            return JsonResponse({'error': 'Invalid root'}, status=400)
+        root = get_object_or_404(Comment, id=root_id, post=post)
+        path = root.path
+
+    comments = Comment.thread_of(post.id, path).select_related('user', 'user__profile')
+    return JsonResponse({'comments': [_comment_json(comment) for comment in comments]})
+
 
 def get_daily_quote():
     """
@@ -308,8 +529,8 @@ def toggle_follow(request, username):
         return JsonResponse({
             'success': True,
             'is_following': is_following,
-            'followers_count': target_profile.followers.count(),
-            'following_count': current_profile.following.count(),
+            'followers_count': target_profile.followers_count,
+            'following_count': current_profile.following_count,
             'message': f'You are now {"following" if is_following else "not following"} {target_user.username}'
         })
         
@@ -317,33 +538,84 @@ def toggle_follow(request, username):
         print(f"Unexpected error in toggle_follow: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
+def _follow_list_page(request, user, followers):
+    """
+    One page of ``user``'s followers (or followees), most recent follow
+    first, paginated by a cursor on the follow row, together with the
+    viewer's follow status for the whole page from a single query.
+    """
+    profile, created = UserProfile.objects.get_or_create(user=user)
+    follows = UserProfile.following.through.objects
+    if followers:
+        rows = follows.filter(to_userprofile=profile)
+        listed = 'from_userprofile'
+    else:
+        rows = follows.filter(from_userprofile=profile)
+        listed = 'to_userprofile'
+    # Post counts of the listed users in the same query
+    posts_count = Post.objects.filter(user_id=OuterRef(f'{listed}__user_id')).order_by() \
+        .values('user_id').annotate(n=Count('*')).values('n')
+    rows = rows.select_related(f'{listed}__user').annotate(
+        posts_count=Coalesce(Subquery(posts_count), 0)
+    )
+
+    page_size = getattr(settings, 'FOLLOW_LIST_PAGE_SIZE', 50)
+    rows, next_cursor = paginate(rows, request.GET.get('cursor'), page_size, field='id')
+    profiles = []
+    for row in rows:
+        listed_profile = getattr(row, listed)
+        listed_profile.posts_count = row.posts_count
+        profiles.append(listed_profile)
+
+    # Add follow status for current user
+    followed_ids = set()
+    if request.user.is_authenticated and profiles:
+        current_user_profile, created = UserProfile.objects.get_or_create(user=request.user)
+        followed_ids = set(follows.filter(
+            from_userprofile=current_user_profile,
+            to_userprofile_id__in=[p.id for p in profiles],
+        ).values_list('to_userprofile_id', flat=True))
+
+    profiles_with_status = [
+        {'profile': p, 'is_following': p.id in followed_ids}
+        for p in profiles
+    ]
+    return profiles_with_status, next_cursor
+
+@login_required
+def follow_suggestions(request):
+    """Return the viewer's precomputed "who to follow" suggestions as JSON"""
+    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    return JsonResponse({
+        'suggestions': [
+            {
+                'username': suggested.user.username,
+                'full_name': suggested.user.get_full_name(),
+                'profile_image': suggested.profile_image.url if suggested.profile_image else None,
+                'mutual_count': mutual_count,
+            }
+            for suggested, mutual_count in get_suggestions(profile)
+        ]
+    })
+
+@staff_member_required
+def follow_cache_stats(request):
+    """Report the memory held by this process's follow-graph cache"""
+    return JsonResponse({'enabled': follow_cache_enabled(), **follow_cache.stats()})
+
 @login_required
 def followers_list(request, username):
     """Display list of followers for a user"""
     user = get_object_or_404(User, username=username)
-    profile, created = UserProfile.objects.get_or_create(user=user)
-    
-    followers = profile.followers.all().select_related('user')
-    
-    # Add follow status for current user
-    current_user_profile = None
-    if request.user.is_authenticated:
-        current_user_profile, created = UserProfile.objects.get_or_create(user=request.user)
-    
-    # Create a list with follow status
-    followers_with_status = []
-    for follower in followers:
-        is_following = False
-        if current_user_profile and current_user_profile != follower:
-            is_following = current_user_profile.is_following(follower)
-        followers_with_status.append({
-            'profile': follower,
-            'is_following': is_following
-        })
-    
+    try:
+        followers, next_cursor = _follow_list_page(request, user, followers=True)
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+
     context = {
         'profile_user': user,
-        'followers': followers_with_status,
+        'followers': followers,
+        'next_cursor': next_cursor,
         'is_followers_page': True,
     }
     return render(request, 'followers_following.html', context)
@@ -352,60 +624,79 @@ def followers_list(request, username):
 def following_list(request, username):
     """Display list of users that this user is following"""
     user = get_object_or_404(User, username=username)
-    profile, created = UserProfile.objects.get_or_create(user=user)
-    
-    following = profile.following.all().select_related('user')
-    
-    # Add follow status for current user (all following users should show "Unfollow")
-    current_user_profile = None
-    if request.user.is_authenticated:
-        current_user_profile, created = UserProfile.objects.get_or_create(user=request.user)
-    
-    # Create a list with follow status
-    following_with_status = []
-    for following_profile in following:
-        is_following = False
-        if current_user_profile and current_user_profile != following_profile:
-            is_following = current_user_profile.is_following(following_profile)
-        following_with_status.append({
-            'profile': following_profile,
-            'is_following': is_following
-        })
-    
+    try:
+        following, next_cursor = _follow_list_page(request, user, followers=False)
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+
     context = {
         'profile_user': user,
-        'following': following_with_status,
+        'following': following,
+        'next_cursor': next_cursor,
         'is_following_page': True,
     }
     return render(request, 'followers_following.html', context)
 
 
 # Chat Views
+def inbox_queryset(user):
+    """
+    The user's conversations, each annotated with its last message and
+    unread count, the other participants prefetched with their profiles,
+    so the inbox renders without a query per conversation.
+    """
+    last = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+    return Conversation.objects.filter(participants=user).annotate(
+        last_message_id=Subquery(last.values('id')[:1]),
+        last_message_content=Subquery(last.values('content')[:1]),
+        last_message_sender_id=Subquery(last.values('sender_id')[:1]),
+        last_message_at=Subquery(last.values('created_at')[:1]),
+        last_activity=Coalesce(Subquery(last.values('created_at')[:1]), 'created_at'),
+        unread_count=Subquery(
+            ConversationMember.objects.filter(conversation=OuterRef('pk'), user=user).values('unread_count')
+        ),
+    ).prefetch_related(
+        Prefetch('participants', queryset=User.objects.select_related('profile'))
+    )
+
 @login_required
 def conversations_list(request):
     """Display list of conversations for the current user"""
-    conversations = Conversation.objects.filter(
-        participants=request.user
-    ).annotate(
-        latest_message_time=Max('messages__created_at')
-    ).order_by('-latest_message_time')
-    
+    page_size = getattr(settings, 'CONVERSATIONS_PAGE_SIZE', 20)
+    try:
+        conversations, next_cursor = paginate(
+            inbox_queryset(request.user), request.GET.get('cursor'), page_size, field='last_activity'
+        )
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+
     # Add conversation details
     conversation_data = []
     for conversation in conversations:
-        other_participant = conversation.get_other_participant(request.user)
-        last_message = conversation.last_message
-        has_unread = conversation.has_unread_messages(request.user)
-        
+        other_participant = next(
+            (user for user in conversation.participants.all() if user.id != request.user.id), None
+        )
+        last_message = None
+        if conversation.last_message_id:
+            last_message = Message(
+                id=conversation.last_message_id,
+                conversation=conversation,
+                sender_id=conversation.last_message_sender_id,
+                content=conversation.last_message_content,
+                created_at=conversation.last_message_at,
+            )
+
         conversation_data.append({
             'conversation': conversation,
             'other_participant': other_participant,
             'last_message': last_message,
-            'has_unread': has_unread
+            'has_unread': conversation.unread_count > 0,
+            'unread_count': conversation.unread_count,
         })
     
     context = {
         'conversations': conversation_data,
+        'next_cursor': next_cursor,
     }
     return render(request, 'conversations_list.html', context)
 
@@ -423,17 +714,24 @@ def chat_room(request, conversation_id):
     # Get other participant
     other_participant = conversation.get_other_participant(request.user)
     
-    # Get messages (latest 50)
-    chat_messages = conversation.messages.select_related('sender').order_by('-created_at')[:50]
-    chat_messages = list(reversed(chat_messages))
+    # Get the latest page of messages
+    chat_messages, has_more_history = get_message_page(conversation.id)
     
     # Mark messages as read
-    conversation.messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    conversation.mark_read(request.user)
+
+    # Read by the others once it is behind all of their read cursors; later
+    # receipts arrive over the socket
+    read_up_to = conversation.memberships.exclude(user=request.user).aggregate(
+        n=Min('last_read_message_id')
+    )['n'] or 0
     
     context = {
         'conversation': conversation,
         'other_participant': other_participant,
         'messages': chat_messages,
+        'has_more_history': has_more_history,
+        'read_up_to': read_up_to,
         'conversation_id': conversation_id,
     }
     return render(request, 'chat_room.html', context)
@@ -489,11 +787,7 @@ def send_message_ajax(request):
             return JsonResponse({'success': False, 'error': 'Message too long'})
         
         # Create message
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=request.user,
-            content=message_content
-        )
+        message = conversation.post_message(request.user, message_content)
         
         return JsonResponse({
             'success': True,
@@ -512,7 +806,11 @@ def send_message_ajax(request):
 
 @login_required
 def get_messages_ajax(request, conversation_id):
-    """Get messages for a conversation via AJAX"""
+    """
+    Get messages for a conversation via AJAX. The latest page by default,
+    ``before_id`` pages back into older history and ``after_id`` fetches
+    what came after a message; ``limit`` caps the page size.
+    """
     try:
         conversation = get_object_or_404(Conversation, id=conversation_id)
         
@@ -520,23 +818,35 @@ def get_messages_ajax(request, conversation_id):
         if not conversation.participants.filter(id=request.user.id).exists():
             return JsonResponse({'success': False, 'error': 'Access denied'})
         
-        # Get messages (latest 50)
-        messages_qs = conversation.messages.select_related('sender').order_by('-created_at')[:50]
+        try:
+            before_id, after_id, limit = (
+                int(request.GET[name]) if request.GET.get(name) else None
+                for name in ('before_id', 'after_id', 'limit')
+            )
+            page, has_more = get_message_page(conversation.id, before_id, after_id, limit)
+        except (ValueError, InvalidCursor):
+            return JsonResponse({'success': False, 'error': 'Invalid cursor'})
         
+        # Read by the others once it is behind all of their read cursors
+        read_up_to = conversation.memberships.exclude(user=request.user).aggregate(
+            n=Min('last_read_message_id')
+        )['n'] or 0
+
         messages_data = []
-        for message in reversed(messages_qs):
+        for message in page:
             messages_data.append({
                 'id': message.id,
                 'content': message.content,
                 'sender': message.sender.username,
                 'sender_id': message.sender.id,
                 'timestamp': message.created_at.isoformat(),
-                'is_read': message.is_read
+                'is_read': message.id <= read_up_to
             })
         
         return JsonResponse({
             'success': True,
-            'messages': messages_data
+            'messages': messages_data,
+            'has_more': has_more,
         })
         
     except Exception as e:
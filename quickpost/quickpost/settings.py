@@ -82,6 +82,20 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache shared by every worker process (on the Redis server the channel
+# layer uses): reaction indexes, follow versions and chat presence are
+# invalidated or read by other processes than the one that wrote them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
+
+# The test suite runs without a Redis server: manage.py test swaps in the
+# cache of quickpost/test_settings.py, other runners can use that module
+TEST_RUNNER = 'quickpost.test_runner.LocalCacheTestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -141,6 +155,91 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR,'static')]
 
+# Number of posts per feed page
+FEED_PAGE_SIZE = 20
+
+# Latest comments embedded in each feed card, and page size of the
+# on-demand comments endpoint
+FEED_COMMENT_PREVIEW = 2
+COMMENTS_PAGE_SIZE = 20
+
+# Largest page the JSON feed API (post/api/posts/) will stream
+API_MAX_PAGE_SIZE = 1000
+
+# Profiles per page of the followers/following lists
+FOLLOW_LIST_PAGE_SIZE = 50
+
+# Answer follow checks from per-process sorted arrays of followee IDs,
+# reloaded when the follow_version key in the cache changes. The version is
+# checked at most once per FOLLOW_CACHE_RECHECK_INTERVAL seconds per list,
+# which bounds how long other processes answer from an old list.
+FOLLOW_CACHE_ENABLED = False
+FOLLOW_CACHE_MAX_USERS = 10000
+FOLLOW_CACHE_RECHECK_INTERVAL = 1.0
+
+# "Who to follow" suggestions kept per profile (see post/suggestions.py)
+FOLLOW_SUGGESTIONS_TOP_K = 10
+
+# Conversations per page of the inbox
+CONVERSATIONS_PAGE_SIZE = 20
+
+# Messages per page of chat history (first load and each backfill)
+CHAT_HISTORY_PAGE_SIZE = 50
+
+# Write chat messages in micro-batches: whatever arrives within the window
+# (up to CHAT_BATCH_MAX_SIZE) shares one transaction. At most
+# CHAT_BATCH_QUEUE_SIZE messages wait per process; beyond that senders wait
+CHAT_BATCHED_WRITES = False
+CHAT_BATCH_WINDOW_MS = 5
+CHAT_BATCH_MAX_SIZE = 200
+CHAT_BATCH_QUEUE_SIZE = 5000
+
+# Chat presence and typing (cache and channel layer only): seconds a member
+# stays online without a heartbeat (clients beat every third of that), and
+# seconds between typing broadcasts of a socket
+CHAT_PRESENCE_TTL = 45
+CHAT_TYPING_INTERVAL = 3
+
+# Seconds between two read cursor writes of a chat socket; read reports in
+# between are coalesced into the next write
+CHAT_READ_RECEIPT_INTERVAL = 2
+
+# Home timeline (fan-out on write): entries kept per user, and how many of
+# an author's recent posts are copied in when someone follows them
+TIMELINE_MAX_LENGTH = 800
+TIMELINE_BACKFILL_SIZE = 50
+
+# Accounts with more followers than this are pulled into timelines at read
+# time instead of being fanned out on write, and stay pulled for good
+TIMELINE_FANOUT_FOLLOWER_LIMIT = 10000
+
+# Top feed: posts older than the window drop out, and gravity controls how
+# quickly engagement decays with age
+RANK_WINDOW_HOURS = 24
+RANK_GRAVITY = 1.8
+# A Top feed reader pages through a snapshot of the ranking taken on their
+# first page: how many posts it holds and how long it is kept
+TOP_FEED_MAX_POSTS = 1000
+TOP_FEED_SNAPSHOT_TIMEOUT = 1800
+
+# Seconds a rendered post card stays cached. Cards are re-keyed on every
+# change, this only bounds how stale comment timestamps can get.
+POST_CARD_CACHE_TIMEOUT = 300
+
+# Write-behind reaction buffer: toggles are acknowledged from the shared
+# cache and flushed in batches every REACTION_BUFFER_FLUSH_INTERVAL seconds
+# by whichever worker gets there first. Needs a cache shared by all workers
+# (Redis), which also keeps acknowledged toggles across worker crashes.
+REACTION_WRITE_BEHIND = False
+REACTION_BUFFER_FLUSH_INTERVAL = 1.0
+
+# Most toggles accepted by one post/reactions/batch/ request
+REACTION_BATCH_MAX_SIZE = 100
+
+# Seconds a viewer's reaction index (sorted liked/disliked post IDs) stays
+# cached. It is dropped on every toggle, this only bounds memory use.
+REACTION_INDEX_TIMEOUT = 3600
+
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/post/'
 LOGOUT_REDIRECT_URL = 'home'
@@ -0,0 +1,13 @@
+"""
+Settings for running the test suite without a Redis server, e.g.
+DJANGO_SETTINGS_MODULE=quickpost.test_settings for runners other than
+manage.py test.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}